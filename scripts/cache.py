@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# Part of automaid -- a Python package to process MERMAID files
+# pymaid environment (Python v3.10)
+#
+# On-disk, content-addressed cache of (expensive to compute) bytes, shared
+# across runs, with a size cap and least-recently-used eviction
+
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+
+import setup
+
+# Get current version number.
+version = setup.get_version()
+
+def version_key(name):
+    '''Return a sort key of automaid version `name`, e.g., "v4.5.9" or "v4.6.0-A"
+    (a pre-release sorts before its release), or None if it is not a version
+
+    '''
+    catch = re.fullmatch(r"v(\d+)\.(\d+)\.(\d+)(?:-([0-9A-Z]))?", name)
+    if catch is None:
+        return None
+
+    major, minor, patch, pre_release = catch.groups()
+    return (int(major), int(minor), int(patch), pre_release is None, pre_release or "")
+
+class Cache:
+    '''Directory of files named by the hash of what they were computed from
+
+    Entries live in `path`/<version>/, so that a new automaid version (which may
+    change the algorithms that computed them) starts afresh; directories of
+    older versions are deleted on instantiation (those of newer versions are
+    left to the automaid instances that may share the cache).  Reading an entry
+    refreshes its modification time and, whenever the cache grows beyond
+    `max_bytes`, the least-recently-used entries are deleted.
+
+    Entries are written atomically (temporary file + rename) so that several
+    processes, or automaid instances, may share a cache.
+
+    '''
+
+    def __init__(self, path, max_bytes=2**30):
+        self.path = os.path.join(path, version)
+        self.max_bytes = max_bytes
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+        # Invalidate entries written by older versions
+        for entry in os.scandir(path):
+            entry_version = version_key(entry.name)
+            if entry.is_dir() and entry_version is not None and entry_version < version_key(version):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+        # Tally the size of the entries already on disk
+        self.nbytes = sum(entry.stat().st_size for entry in os.scandir(self.path)
+                          if entry.is_file() and not entry.name.startswith("."))
+
+    @staticmethod
+    def key(*parts):
+        '''Return the hexadecimal SHA-256 hash of `parts` (bytes or str)
+
+        '''
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+
+            # Prefix the length of each part so that, e.g., ("ab", "c") and
+            # ("a", "bc") do not collide
+            h.update(len(part).to_bytes(8, "little"))
+            h.update(part)
+
+        return h.hexdigest()
+
+    def get(self, key):
+        '''Return the bytes stored under `key`, or None if not cached
+
+        '''
+        file_path = os.path.join(self.path, key)
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+
+            # Mark as recently used
+            os.utime(file_path)
+
+        except FileNotFoundError:
+            # Never cached, or evicted (maybe by another process)
+            return None
+
+        return data
+
+    def put(self, key, data):
+        '''Store `data` (bytes) under `key`, evicting if over `max_bytes`
+
+        '''
+        if len(data) > self.max_bytes:
+            return
+
+        # An entry overwritten no longer counts
+        file_path = os.path.join(self.path, key)
+        try:
+            self.nbytes -= os.stat(file_path).st_size
+        except FileNotFoundError:
+            pass
+
+        fd, tmp_path = tempfile.mkstemp(prefix=".", dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        os.replace(tmp_path, file_path)
+        self.nbytes += len(data)
+
+        if self.nbytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        '''Delete least-recently-used entries until the cache fills no more than
+        90% of `max_bytes` (so that not every subsequent `put` must evict)
+
+        '''
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.startswith("."):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        # Oldest modification (last use) first
+        entries.sort()
+        self.nbytes = sum(size for _, size, _ in entries)
+        for _, size, file_path in entries:
+            if self.nbytes <= 0.9 * self.max_bytes:
+                break
+
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            self.nbytes -= size
@@ -20,14 +20,15 @@ import glob
 import collections
 
 from obspy import UTCDateTime
-import plotly.offline as plotly
-import plotly.graph_objs as graph
 
 import gps
 import utils
 import setup
 import preprocess
 
+# Plotting libraries, imported on first use
+from utils import plotly, graph
+
 # Get current version number.
 version = setup.get_version()
 
@@ -43,6 +44,7 @@ class Log:
     gps_list = []
     mer_environment = None
     mer_environment_name = None
+    environment = None
     mer_environment_name_exists = False
 
     s41_file_name = None
@@ -139,20 +141,19 @@ class Log:
                 # a single dive, it may take multiple surfacings to finally transmit
                 # them all).
 
-                # Read the Mermaid environment associated to the dive
-                with open(mer_fullfile_name, "rb") as f:
-                    content = f.read().decode("utf-8","replace")
-                    catch = re.findall("<ENVIRONMENT>.+</PARAMETERS>", content, re.DOTALL)
-                    # Sometimes the .MER file exists but it is empty (0037_605CB34D.MER)
-                    if catch:
-                        self.mer_environment = catch[0]
-                        # Get dive ID according to .MER (this iterator can be reset)
-                        # NB, a dive ID does not necessarily mean MERMAID actually dove
-                        # It just means the float transmitted a .MER file(?)
-                        # See, e.g., dive #97 float 25 (25_5EFEC58E.LOG, 25_5EFF43E0.MER)
-                        # That log shows a REBOOT, TESTMD, and an old .MER transmission
-                        dive_id = re.search(r"<DIVE ID=(\d+)", self.mer_environment)
-                        self.dive_id = int(dive_id.group(1))
+                # The Mermaid environment associated to the dive (parsed once,
+                # when `events` read the same .MER file)
+                environment = events.get_environment(mer_fullfile_name)
+                # Sometimes the .MER file exists but it is empty (0037_605CB34D.MER)
+                if environment is not None:
+                    self.environment = environment
+                    self.mer_environment = environment.text
+                    # Get dive ID according to .MER (this iterator can be reset)
+                    # NB, a dive ID does not necessarily mean MERMAID actually dove
+                    # It just means the float transmitted a .MER file(?)
+                    # See, e.g., dive #97 float 25 (25_5EFEC58E.LOG, 25_5EFF43E0.MER)
+                    # That log shows a REBOOT, TESTMD, and an old .MER transmission
+                    self.dive_id = environment.dive_id
 
         # Get list of gps even with partial file
         self.gps_list_from_mermaid = events.get_gps_between(self.start_date, self.end_date);
@@ -160,19 +161,20 @@ class Log:
         # (the metadata header, which does not necessarily relate to the
         # events and their binary data below that header in the same .MER)
         self.events = events.get_events_between(self.start_date, self.end_date)
-        # Set and parse info from .MER file and invert wavelet transform any binary data
-        # (cannot invert the data without vital information from the .MER environment)
+        # Set and parse info from .MER file (the binary data cannot be inverted,
+        # see `Events.set_processed_data`, without vital information from the
+        # .MER environment)
         if not self.mer_environment and len(self.events) > 0:
             # Mer file is not logged on LOG file but events are found during this dive
             # E.g : 12_65B5EC90.LOG / 12_65BF9636.MER
-            self.mer_environment = self.events[0].default_mer_environment
+            self.environment = self.events[0].default_environment
+            self.mer_environment = self.environment.text
 
         for event in self.events:
             event.set_kstnm_kinst(self.kstnm, self.kinst)
-            event.set_environment(self.mer_environment_name, self.mer_environment)
+            event.set_environment(self.mer_environment_name, self.environment)
             event.find_measured_sampling_frequency()
             event.set_uncorrected_starttime()
-            event.set_processed_data()
         # Re-sort events based on starttime (rather than INFO DATE)
         self.events.sort(key=lambda x: x.uncorrected_starttime)
         # Merge gps list into an unique
@@ -560,9 +562,10 @@ class Cycle:
         with open(processed_path, "w") as f:
             f.write(environment)
 
-    def write_cycle_html(self, csv_file, optimize=False, include_plotly=True):
+    def write_cycle_html(self, csv_file, optimize=False, include_plotly=True, html=True):
         '''
-            Generates a dive plot for a complete cycle
+            Generates a dive plot for a complete cycle (and, if `csv_file`,
+            a .csv of its depths; only that .csv if not `html`)
         '''
         if not self.processed_path :
             return
@@ -572,7 +575,7 @@ class Cycle:
             return
         # Check if file exist
         processed_path = self.processed_path + self.cycle_name[:-4] + '.html'
-        if os.path.exists(processed_path):
+        if os.path.exists(processed_path if html else processed_path.replace(".html",".csv")):
             return
 
         # If the float is not diving don't plot anything
@@ -596,6 +599,19 @@ class Cycle:
         p_val = [-int(p[0])/100. for p in pressure]
         p_date = [p[1] for p in pressure]
 
+        if csv_file:
+            p_date_format = [UTCDateTime.strftime(UTCDateTime(date), "%Y%m%dT%H%M%S") for date in p_date]
+            csv_path = processed_path.replace(".html",".csv")
+            rows = zip(p_date_format,p_val)
+            with open(csv_path, mode='w') as csv_file:
+                csv_file = csv.writer(csv_file, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                for row in rows:
+                    csv_file.writerow(row)
+
+        # (plotly is only imported, below, if the html is to be written)
+        if not html:
+            return
+
         # Plotly you can implement WebGL with Scattergl() in place of Scatter()
         # for increased speed, improved interactivity, and the ability to plot even more data.
         Scatter = graph.Scatter
@@ -609,15 +625,6 @@ class Cycle:
                                              width=2),
                                    mode='lines+markers')
 
-        if csv_file:
-            p_date_format = [UTCDateTime.strftime(UTCDateTime(date), "%Y%m%dT%H%M%S") for date in p_date]
-            csv_path = processed_path.replace(".html",".csv")
-            rows = zip(p_date_format,p_val)
-            with open(csv_path, mode='w') as csv_file:
-                csv_file = csv.writer(csv_file, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                for row in rows:
-                    csv_file.writerow(row)
-
         # Add vertical lines
         # Find minimum and maximum for Y axis of vertical lines
         minimum = int(min(p_val) + 0.05*min(p_val))
@@ -1106,6 +1113,10 @@ class Cycle:
         for event in self.events:
             event.write_mhpsd(self.processed_path, creation_datestr)
 
+    def release_events_data(self):
+        for event in self.events:
+            event.release_data()
+
     def print_len(self):
         len_str  = "   Date: {:s} -> {:s} ({:.2f} days; first/last line of {:s})" \
                    .format(str(self.start_date)[0:19], str(self.end_date)[0:19],
@@ -15,18 +15,11 @@ import sys
 import os
 import re
 import glob
-import subprocess
+import mmap
+import pickle
+import hashlib
+import collections
 import numpy as np
-import matplotlib
-
-def_mermaid_backend = os.environ.get("MERMAID_BACKEND", matplotlib.get_backend())
-if def_mermaid_backend :
-    print("backend for matplotlib : " + def_mermaid_backend)
-    matplotlib.use(def_mermaid_backend)
-    
-import matplotlib.pyplot as plt
-import plotly.offline as plotly
-import plotly.graph_objs as graph
 
 from obspy import UTCDateTime
 from obspy.core.trace import Trace
@@ -37,12 +30,383 @@ import gps
 import sys
 import setup
 import utils
+import icdf24
 import mermaidpsd
 import time
 
+# Plotting libraries, imported on first use
+from utils import plt, plotly, graph
+
 # Get current version number.
 version = setup.get_version()
 
+# Invert wavelet coefficients in memory with `icdf24.icdf24` (default), or with
+# the original C executables in bin/ with `icdf24.icdf24_subprocess`
+icdf24_method = os.environ.get("MERMAID_ICDF24", "numpy")
+
+# Number of worker processes among which `Events.set_processed_data` fans out
+# the inversions (1: serially in this process; 0: one per CPU)
+icdf24_workers = int(os.environ.get("MERMAID_ICDF24_WORKERS", 1))
+
+# Pool of `icdf24_workers` processes reused by every call to
+# `Events.set_processed_data` (set by main.py; None to create one per call)
+icdf24_executor = None
+
+# On-disk `cache.Cache` of inverted traces, shared across runs (set by main.py;
+# None to always invert)
+icdf24_cache = None
+
+# On-disk `cache.Cache` of the indexes of .MER files (environment and event
+# headers and offsets, see `get_mer_index`), shared across runs (set by main.py;
+# None to always parse)
+mer_cache = None
+
+# Version of the cached indexes of .MER files: increment it whenever `index_mer`,
+# `EventHeader` or `MerEnvironment` (or what they are built from) changes
+mer_index_version = 1
+
+# Read-only memory maps of the .MER files of lazy events, keyed by file path,
+# the least recently used of which are closed (and reopened on demand) beyond
+# `max_mer_mmaps` to limit the number of open file descriptors
+mer_mmaps = collections.OrderedDict()
+max_mer_mmaps = 128
+
+def get_mer_mmap(mer_file):
+    '''Return the (shared) read-only memory map of .MER file `mer_file`
+
+    '''
+    if mer_file in mer_mmaps:
+        mer_mmaps.move_to_end(mer_file)
+
+    else:
+        with open(mer_file, "rb") as f:
+            mer_mmaps[mer_file] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(mer_mmaps) > max_mer_mmaps:
+            mer_mmaps.popitem(last=False)[1].close()
+
+    return mer_mmaps[mer_file]
+
+def close_mer_mmaps():
+    '''Close all memory maps of .MER files (the binary of lazy events that was
+    not materialized, or was released, is then only readable for as long as
+    their .MER files exist)
+
+    '''
+    for mer_mmap in mer_mmaps.values():
+        mer_mmap.close()
+    mer_mmaps.clear()
+
+# An attribute (NAME=VALUE) of the <INFO .../> or <FORMAT .../> element of the
+# header of an event block
+HEADER_ATTRIBUTE = re.compile(rb"(\w+)=([^\s>]+?)(?=\s|/?>|$)")
+
+# Dates of an event header: "INFO DATE" (with microseconds for detected and
+# Stanford PSD events; truncated to the second for requested events) and the
+# "FNAME" of a requested event (the recording file and its starttime)
+HEADER_DATE = re.compile(rb"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{6}))?")
+HEADER_FNAME = re.compile(rb"(\d{4})-(\d{2})-(\d{2})T(\d{2})_(\d{2})_(\d{2})(?:\.?(\d{6}))?")
+
+class EventHeader:
+    '''The attributes of the <INFO .../> and <FORMAT .../> elements of the header
+    of an event block, tokenized once
+
+    Each attribute named below is None if absent (or malformed); `attrs` holds
+    the raw bytes value of every attribute (the first, if repeated).
+
+    Attrs:
+        info_date (UTCDateTime): INFO DATE, or None if without microseconds
+        info_date_s (UTCDateTime): INFO DATE truncated to the second
+        rounds (int): ROUNDS (Stanford PSD events only)
+        stages (int): STAGES (scales of the wavelet transform; -1 for raw data)
+        trig (int): TRIG (detected events only)
+        pressure (float): PRESSURE, in dbar
+        temperature (float): TEMPERATURE
+        criterion (float): CRITERION
+        snr (float): SNR
+        fname (UTCDateTime): starttime of the recording file (FNAME), to the
+                             microsecond if given (requested events only)
+        smp_offset (int): SMP_OFFSET, in samples from `fname`
+        bytes_per_sample (int): BYTES_PER_SAMPLE
+        length (int): LENGTH, in samples
+
+    '''
+    ints = ("ROUNDS", "STAGES", "TRIG", "SMP_OFFSET", "BYTES_PER_SAMPLE", "LENGTH")
+    floats = ("PRESSURE", "TEMPERATURE", "CRITERION", "SNR")
+
+    def __init__(self, content, start=0, end=None):
+        '''Tokenize the header `content[start:end]` (searched in place; `content`
+        is any bytes-like object, e.g., a .MER memory map)
+
+        '''
+        if end is None:
+            end = len(content)
+
+        self.attrs = {}
+        for match in HEADER_ATTRIBUTE.finditer(content, start, end):
+            self.attrs.setdefault(match.group(1).decode("utf-8", "replace"), match.group(2))
+
+        for name in self.ints + self.floats:
+            value = self.attrs.get(name)
+            if value is not None:
+                try:
+                    value = int(value) if name in self.ints else float(value)
+                except ValueError:
+                    value = None
+            setattr(self, name.lower(), value)
+
+        self.info_date = None
+        self.info_date_s = None
+        match = HEADER_DATE.match(self.attrs.get("DATE", b""))
+        if match:
+            date = [int(x) for x in match.groups()[:6]]
+            self.info_date_s = UTCDateTime(*date)
+            if match.group(7) is not None:
+                self.info_date = UTCDateTime(*date, int(match.group(7)))
+
+        self.fname = None
+        match = HEADER_FNAME.match(self.attrs.get("FNAME", b""))
+        if match:
+            self.fname = UTCDateTime(*[int(x) for x in match.groups()[:6]])
+            if match.group(7) is not None:
+                self.fname += float("0." + match.group(7).decode("utf-8"))
+
+    def __repr__(self):
+        return "EventHeader({})".format(self.attrs)
+
+class MerEnvironment:
+    '''The environment ("<ENVIRONMENT>...</PARAMETERS>") of a .MER file, parsed
+    once (see `get_mer_environment`) and shared by `Events`, `cycles.Log` and
+    `Event`
+
+    Attrs:
+        mer_environment_name (str): .MER file name
+        text (str): The environment itself
+        gps (list): GPS fixes (`gps.GPS`) of the environment
+        dive_id (int): DIVE ID, or None
+        measured_fs (float): TRUE_SAMPLE_FREQ FS_Hz, or None
+        normalized (str): NORMALIZED (flavor of inverse wavelet transform), or None
+        edges_correction (str): EDGES_CORRECTION (idem), or None
+        stanford_duration, stanford_period, stanford_win_len, stanford_win_type,
+        stanford_overlap, stanford_db_offset (str): Stanford PSD parameters
+            (DURATION_h, PROCESS_PERIOD_h, WINDOW_LEN, WINDOW_TYPE,
+            OVERLAP_PERCENT, dB_OFFSET), all "" if no DURATION_h
+
+    '''
+    def __init__(self, mer_environment_name, text):
+        self.mer_environment_name = mer_environment_name
+        self.text = text
+        self.gps = gps.get_gps_from_mer_environment(mer_environment_name, text)
+
+        def first(pattern):
+            catch = re.search(pattern, text)
+            return catch.group(1) if catch else None
+
+        dive_id = first(r"<DIVE ID=(\d+)")
+        self.dive_id = int(dive_id) if dive_id is not None else None
+
+        measured_fs = first(r"TRUE_SAMPLE_FREQ FS_Hz=(\d+\.\d+)")
+        self.measured_fs = float(measured_fs) if measured_fs is not None else None
+
+        self.normalized = first(r" NORMALIZED=(\d+)")
+        self.edges_correction = first(r" EDGES_CORRECTION=(\d+)")
+
+        # Shouldn't these attrs remain `None` instead of `""` if not a
+        # Stanford float?
+        self.stanford_duration = first(r"DURATION_h=(\d+)")
+        if self.stanford_duration is not None:
+            self.stanford_period = first(r"PROCESS_PERIOD_h=(\d+)")
+            self.stanford_win_len = first(r"WINDOW_LEN=(\d+)")
+            self.stanford_win_type = first(r"WINDOW_TYPE=(\w+)")
+            self.stanford_overlap = first(r"OVERLAP_PERCENT=(\d+)")
+            self.stanford_db_offset = first(r"dB_OFFSET=(\d+)")
+        else:
+            self.stanford_duration = ""
+            self.stanford_period = ""
+            self.stanford_win_len = ""
+            self.stanford_win_type = ""
+            self.stanford_overlap = ""
+            self.stanford_db_offset = ""
+
+    @classmethod
+    def of(cls, mer_environment, mer_environment_name=None):
+        '''Return `mer_environment` as a `MerEnvironment` (parsed anew if it is a
+        string, e.g., of a pickle; None if None)
+
+        '''
+        if mer_environment is None or isinstance(mer_environment, cls):
+            return mer_environment
+
+        return cls(mer_environment_name, mer_environment)
+
+# Parsed environments (or None, if they have none) of the .MER files, keyed by
+# path, size and modification time (see `get_mer_environment`)
+mer_environments = {}
+
+def get_mer_environment(mer_file, content=None, span=None):
+    '''Return the `MerEnvironment` of .MER file `mer_file`, or None if it has
+    none (e.g., it is empty), parsed on first request only
+
+    Args:
+        mer_file (str): .MER file path
+        content (bytes-like): Its content, if at hand (def: memory mapped)
+        span (tuple): The span of its environment in `content` (see `index_mer`),
+                      if known
+
+    '''
+    key = mer_environment_key(mer_file)
+    if key not in mer_environments:
+        environment = None
+        if content is None:
+            content = get_mer_mmap(mer_file) if key[1] > 0 else b""
+        if span is None:
+            span = index_mer_environment(content)
+        if span is not None:
+            environment = MerEnvironment(os.path.basename(mer_file),
+                                         content[slice(*span)].decode("utf-8","replace"))
+        mer_environments[key] = environment
+
+    return mer_environments[key]
+
+def get_mer_index(mer_file, content):
+    '''Return the parsed environment (`MerEnvironment`, or None) and the event
+    spans (see `index_mer`) of .MER file `mer_file`, read from `mer_cache` if
+    this very file (same name, size and content hash) was parsed before, else
+    parsed and added to `mer_cache`
+
+    '''
+    cache_key = None
+    if mer_cache is not None:
+        cache_key = mer_cache.key(str(mer_index_version), os.path.basename(mer_file),
+                                  str(len(content)), hashlib.sha256(content).digest())
+        cached = mer_cache.get(cache_key)
+        if cached is not None:
+            mer_environment, mer_event_spans = pickle.loads(cached)
+            mer_environments[mer_environment_key(mer_file)] = mer_environment
+            return mer_environment, mer_event_spans
+
+    mer_environment_span, mer_event_spans = index_mer(content)
+    mer_environment = None
+    if mer_environment_span is not None:
+        mer_environment = get_mer_environment(mer_file, content, mer_environment_span)
+
+    if cache_key is not None:
+        mer_cache.put(cache_key, pickle.dumps((mer_environment, mer_event_spans)))
+
+    return mer_environment, mer_event_spans
+
+def mer_environment_key(mer_file):
+    '''Return the key of .MER file `mer_file` in `mer_environments`
+
+    '''
+    stat = os.stat(mer_file)
+    return (os.path.normpath(mer_file), stat.st_size, stat.st_mtime_ns)
+
+def clear_mer_environments():
+    '''Forget the parsed environments of all .MER files (e.g., about to be deleted)
+
+    '''
+    mer_environments.clear()
+
+def index_mer_environment(content):
+    '''Return the (start, end) span of the environment of a .MER file from its
+    first "<ENVIRONMENT>" to its last "</PARAMETERS>" (the former greedy
+    `re.findall(b"<ENVIRONMENT>.+</PARAMETERS>", content, re.DOTALL)[0]`), or
+    None if it has none
+
+    '''
+    environment_start = content.find(b"<ENVIRONMENT>")
+    parameters_end = content.rfind(b"</PARAMETERS>")
+    if environment_start != -1 and parameters_end > environment_start + len(b"<ENVIRONMENT>"):
+        return (environment_start, parameters_end + len(b"</PARAMETERS>"))
+
+    return None
+
+def index_mer(content):
+    '''Index the environment and event blocks of a .MER file in one forward pass
+    over its event blocks, by offset, without copying any part of it
+
+    Args:
+        content (bytes-like): .MER file content (e.g., its `get_mer_mmap`)
+
+    Returns:
+        tuple: (start, end) span of its "<ENVIRONMENT>...</PARAMETERS>", or None
+        list: (header span, binary span, complete, `EventHeader`) of each block
+              following an "<EVENT>" after the (last) "</PARAMETERS>", where
+              `complete` is False if the block was not completely transmitted
+              (its binary span and header are then None if its "<DATA>" is
+              missing, and its header is None if it is otherwise incomplete)
+
+    The spans are those of `index_mer_environment` and of the former
+    `content.split(b'</PARAMETERS>')[-1].split(b'<EVENT>')[1:]` (then split at
+    "<DATA>" and "</DATA>").
+
+    '''
+    view = memoryview(content)
+
+    environment_span = index_mer_environment(content)
+
+    # Offsets of the blocks following each '<EVENT>' after the (last) '</PARAMETERS>'
+    if environment_span is not None:
+        parameters_end = environment_span[1] - len(b"</PARAMETERS>")
+    else:
+        parameters_end = content.rfind(b"</PARAMETERS>")
+    pos = parameters_end + len(b"</PARAMETERS>") if parameters_end != -1 else 0
+    event_starts = []
+    while True:
+        pos = content.find(b"<EVENT>", pos)
+        if pos == -1:
+            break
+        pos += len(b"<EVENT>")
+        event_starts.append(pos)
+    event_ends = [start - len(b"<EVENT>") for start in event_starts[1:]] + [len(content)]
+
+    event_spans = []
+    for event_start, event_end in zip(event_starts, event_ends):
+        # Complete blocks start with the INFO line and end with </EVENT>
+        complete = view[event_start:event_start+14] == b"\n\r\t<INFO DATE=" \
+            and view[max(event_start, event_end-22):event_end] == b"\n\r\t</DATA>\n\r</EVENT>\n\r"
+
+        header_end = content.find(b"<DATA>\x0A\x0D", event_start, event_end)
+        if header_end == -1:
+            event_spans.append(((event_start, event_end), None, False, None))
+            continue
+
+        # The actual binary data contained in this </EVENT> block (the seismogram)
+        # N.B:
+        # "\x0A" is "\n": True
+        # "\x0D" is "\r": True
+        # "\x09" is "\t": True
+        # https://docs.python.org/2/reference/lexical_analysis.html#string-and-bytes-literals
+        #
+        # Equivalent to `event.split(b"<DATA>\x0A\x0D")[1].split(b"\x0A\x0D\x09</DATA>")[0]`
+        binary_start = header_end + len(b"<DATA>\x0A\x0D")
+        binary_end = content.find(b"<DATA>\x0A\x0D", binary_start, event_end)
+        if binary_end == -1:
+            binary_end = event_end
+        data_end = content.find(b"\x0A\x0D\x09</DATA>", binary_start, binary_end)
+        if data_end != -1:
+            binary_end = data_end
+
+        # The double split above is not foolproof; if the final data
+        # block in the .MER file ends without </DATA> (i.e., the file
+        # was not completely transmitted), the binary will just run to the
+        # end of the file -- verify that the we actually have the expected
+        # number of bytes (tokenizing the header in place)
+        header = None
+        if complete:
+            header = EventHeader(content, event_start, header_end)
+            if "ROUNDS" not in header.attrs:
+                if header.bytes_per_sample is None or header.length is None:
+                    complete = False
+                else:
+                    complete = binary_end - binary_start == header.bytes_per_sample * header.length
+
+        event_spans.append(((event_start, header_end), (binary_start, binary_end), complete, header))
+
+    view.release()
+    return environment_span, event_spans
+
 class Events:
     '''The Events (plural) class references a SINGLE .MER file, and all events that
      live within it, which may be associated with the environments of multiple
@@ -52,16 +416,25 @@ class Events:
 
     '''
 
-    def __init__(self, base_path=None, mer_name=None):
+    def __init__(self, base_path=None, mer_name=None, lazy=False, files=None):
         self.mer_name = mer_name
         self.base_path = base_path
         self.events = []
         self.gps_info = []
         self.__version__ = version
 
+        # Time index of `events` and `gps_info` (see `set_time_index`)
+        self.event_times = None
+        self.gps_sorted = None
+        self.gps_times = None
+        self.time_index_key = None
+
         # If just a base path to (e.g., a server directory) is passed, load all
-        # .MER files contained there; otherwise read a single input file
-        if self.mer_name is None:
+        # .MER files contained there; otherwise read a single input file, or
+        # the list of .MER files (e.g., on the server) given
+        if files is not None:
+            mer_files = [f for f in files if f.endswith(".MER")]
+        elif self.mer_name is None:
             mer_files = glob.glob(os.path.join(self.base_path, "*.MER"))
         else:
             mer_files = glob.glob(os.path.join(self.base_path, self.mer_name))
@@ -70,59 +443,63 @@ class Events:
             # This .MER file name
             mer_binary_name = mer_file.split("/")[-1]
 
-            # The </EVENT> binary blocks contained in this .MER file
-            with open(mer_file, "rb") as f:
-                content = f.read()
+            # The </EVENT> binary blocks contained in this .MER file, memory
+            # mapped rather than read so that (if `lazy`) events may reference
+            # their binary by offset and length without keeping a copy
+            if os.path.getsize(mer_file) == 0:
+                continue
+            content = get_mer_mmap(mer_file)
 
-            catch = re.findall(b"<ENVIRONMENT>.+</PARAMETERS>", content, re.DOTALL)
-            if catch :
-                mer_environment = catch[0].decode("utf-8","replace")
-                self.gps_info += gps.get_gps_from_mer_environment(mer_binary_name,mer_environment)
+            # (the environment is parsed once, and shared with `cycles.Log`;
+            # both are only parsed anew if this .MER file was not parsed by a
+            # previous run)
+            environment, mer_event_spans = get_mer_index(mer_file, content)
+            if environment is not None:
+                mer_environment = environment
+                self.gps_info += mer_environment.gps
 
-            events = content.split(b'</PARAMETERS>')[-1].split(b'<EVENT>')[1:]
-            for event in events:
+            for header_span, binary_span, complete, header in mer_event_spans:
                 # Ensure every event block is complete(ly transmitted)
-                if event[0:14] != b"\n\r\t<INFO DATE=" or event[-22:] != b"\n\r\t</DATA>\n\r</EVENT>\n\r":
+                if not complete:
                     continue
+
                 # The header of this specific </EVENT> block (NOT the </ENVIRONMENT> of
                 # the same .MER file, which may be unrelated (different time))
-                mer_binary_header = event.split(b"<DATA>\x0A\x0D")[0]
-
-                # The actual binary data contained in this </EVENT> block (the seismogram)
-                # N.B:
-                # "\x0A" is "\n": True
-                # "\x0D" is "\r": True
-                # "\x09" is "\t": True
-                # https://docs.python.org/2/reference/lexical_analysis.html#string-and-bytes-literals
-                mer_binary_binary = event.split(b"<DATA>\x0A\x0D")[1].split(b"\x0A\x0D\x09</DATA>")[0]
-
-                # The double split above is not foolproof; if the final data
-                # block in the .MER file ends without </DATA> (i.e., the file
-                # was not completely transmitted), the object 'binary' will just
-                # return everything to the end of the file -- verify that the we
-                # actually have the expected number of bytes (apparently len()
-                # returns the byte-length of a string, though I am not super
-                # happy with this solution because I would prefer to know the
-                # specific encoding used for event binary...)
-                if b" ROUNDS=" not in mer_binary_header:
-                    actual_binary_length = len(mer_binary_binary)
-                    bytes_per_sample = int(re.search(b'BYTES_PER_SAMPLE=(\d+)', mer_binary_header).group(1))
-                    num_samples = int(re.search(b'LENGTH=(\d+)', mer_binary_header).group(1))
-                    expected_binary_length = bytes_per_sample * num_samples
-                    if actual_binary_length != expected_binary_length:
-                        continue
-
-                evt = Event(mer_binary_name, mer_binary_header, mer_binary_binary,mer_environment)
+                mer_binary_header = content[slice(*header_span)]
+                binary_start, binary_end = binary_span
+
+                # Lazy events only reference their binary in the memory map,
+                # and read it on first access
+                if lazy:
+                    mer_binary_binary = None
+                    mer_binary_source = (mer_file, binary_start, binary_end - binary_start)
+                else:
+                    mer_binary_binary = content[binary_start:binary_end]
+                    mer_binary_source = None
+
+                evt = Event(mer_binary_name, mer_binary_header, mer_binary_binary, mer_environment,
+                            mer_binary_source, header)
 
                 # Use weak catchall for obj init issues (e.g., formatting
                 # abnormalities in the .MER file)
                 if evt.info_date:
                     self.events.append(evt)
 
+            # Eager events hold a copy of their binary; the map is not needed
+            if not lazy:
+                mer_mmaps.pop(mer_file).close()
+
         # Sort by events by reported "INFO DATE", which may be 1970 if the clock
         # was reset (the info date has not been corrected for clockdrift)
         self.events.sort(key=lambda x: x.info_date)
 
+    def get_environment(self, mer_file):
+        '''Return the `MerEnvironment` of .MER file `mer_file` (see
+        `get_mer_environment`), or None
+
+        '''
+        return get_mer_environment(mer_file)
+
     def get_events_between(self, begin, end):
         # The dates are not yet corrected for clockdrift, which can be years if
         # the float reset to UNIX time 0 (01-Jan-1970).  So this def actually
@@ -139,18 +516,133 @@ class Events:
         #   </PARAMETERS><EVENT>
         #   <INFO DATE=1970-01-03T10:18:13.513763 ... />
         # "
-        catched_events = []
-        for event in self.events:
-            if begin < event.info_date < end:
-                catched_events.append(event)
-        return sorted(catched_events, key=lambda x: x.info_date)
+        #
+        # Events are sorted by info date, so those strictly between `begin`
+        # and `end` are a slice of the list
+        self.set_time_index()
+        first = np.searchsorted(self.event_times, begin.ns, side="right")
+        last = np.searchsorted(self.event_times, end.ns, side="left")
+        return self.events[first:last]
 
     def get_gps_between(self, begin, end):
-        catched_gps = []
-        for gps in self.gps_info:
-            if begin < gps.date < end:
-                catched_gps.append(gps)
-        return sorted(catched_gps, key=lambda x: x.date)
+        self.set_time_index()
+        first = np.searchsorted(self.gps_times, begin.ns, side="right")
+        last = np.searchsorted(self.gps_times, end.ns, side="left")
+        return self.gps_sorted[first:last]
+
+    def set_time_index(self):
+        '''Index the info dates of `events` (sorted) and the dates of `gps_info`
+        (in a sorted copy, `gps_sorted`) as arrays of epoch nanoseconds, so that
+        `get_events_between` and `get_gps_between` are binary searches
+
+        The index is rebuilt if either list was replaced, or changed length or
+        first or last item, since it was built (see `get_time_index_key`).
+        Any other change -- an item replaced or moved within a list, or the
+        date of an item changed -- must be followed by `clear_time_index`.
+
+        Nanoseconds (int64), rather than float seconds, keep the comparisons
+        with `begin` and `end` exact (strict inequalities, as UTCDateTime).
+
+        '''
+        if self.event_times is not None and self.time_index_key == self.get_time_index_key():
+            return
+
+        self.events.sort(key=lambda x: x.info_date)
+        self.event_times = np.array([event.info_date.ns for event in self.events], dtype=np.int64)
+
+        # (GPS fixes without a date cannot be between any two dates)
+        self.gps_sorted = sorted((gps for gps in self.gps_info if gps.date is not None),
+                                 key=lambda x: x.date)
+        self.gps_times = np.array([gps.date.ns for gps in self.gps_sorted], dtype=np.int64)
+        self.time_index_key = self.get_time_index_key()
+
+    def get_time_index_key(self):
+        '''Return what identifies `events` and `gps_info` for `set_time_index`:
+        the identity and length of each list, and of its first and last items
+
+        '''
+        def key(items):
+            if not items:
+                return (id(items), 0)
+            return (id(items), len(items), id(items[0]), id(items[-1]))
+
+        return key(self.events), key(self.gps_info)
+
+    def clear_time_index(self):
+        '''Discard the index of `set_time_index`, e.g., after an item of `events`
+        or `gps_info` was replaced, so that it is rebuilt on next use
+
+        '''
+        self.event_times = None
+        self.time_index_key = None
+
+    def set_processed_data(self, event_list):
+        '''Call `Event.set_processed_data` for every event in `event_list`
+        (which must have had their environment set), inverting the wavelet
+        coefficients of all WLT events that share the same number of scales,
+        normalization, edges correction and length in a single vectorized pass
+
+        Traces found in `icdf24_cache` (keyed by the hash of the event header,
+        binary and flavor of inversion) are not inverted again, and those that
+        are inverted are added to it.
+
+        The batches are fanned out to MERMAID_ICDF24_WORKERS processes (those
+        of `icdf24_executor`, if set) and their results returned in the
+        original event order.  With MERMAID_ICDF24=subprocess every event is
+        its own batch.  Stanford PSD and RAW events, and those of any batch
+        that failed to invert (whose error is then reported), are processed
+        one at a time.
+
+        Returns:
+            float: CPU time (s) spent by the processes of `icdf24_executor`
+                   (see `icdf24.icdf24_parallel`)
+
+        '''
+        processed_data = {}
+        cache_keys = {}
+        batches = {}
+        for event in event_list:
+            if event.is_stanford_event or event.scales == "-1":
+                continue
+
+            event.set_icdf24_flavor()
+            if icdf24_cache is not None:
+                cache_key = icdf24_cache.key(event.mer_binary_header, event.mer_binary_binary, event.scales,
+                                             event.normalized, event.edges_correction)
+                cached = icdf24_cache.get(cache_key)
+                if cached is not None:
+                    processed_data[id(event)] = np.frombuffer(cached, np.int32)
+                    continue
+
+                cache_keys[id(event)] = cache_key
+
+            if icdf24_method == "subprocess":
+                key = id(event)
+            else:
+                key = (event.scales, event.normalized, event.edges_correction, len(event.mer_binary_binary))
+            batches.setdefault(key, []).append(event)
+
+        batches = list(batches.values())
+        results, cpu_s = icdf24.icdf24_parallel([([event.mer_binary_binary for event in batch],
+                                           batch[0].scales, batch[0].normalized, batch[0].edges_correction)
+                                          for batch in batches],
+                                         workers=icdf24_workers, method=icdf24_method,
+                                         executor=icdf24_executor)
+
+        for batch, result in zip(batches, results):
+            # Let `Event.set_processed_data` report the (first) offending event
+            if isinstance(result, ValueError):
+                continue
+
+            for event, event_data in zip(batch, result):
+                processed_data[id(event)] = event_data
+                if id(event) in cache_keys:
+                    icdf24_cache.put(cache_keys[id(event)], event_data.tobytes())
+
+        for event in event_list:
+            event.set_processed_data(processed_data.get(id(event)))
+
+        return cpu_s
     # def __repr__(self):
     #     return "Events('{}', '{}')".format(self.base_path, self.mer_name)
 
@@ -165,13 +657,30 @@ class Event:
     Only a SINGLE event (event binary block) is referenced by
     Event.mer_binary_name and Event.mer_environment_name
 
+    A "lazy" event is instantiated with `mer_binary_source`, the (.MER file
+    path, offset, length) of its binary, instead of `mer_binary_binary`; the
+    binary is read (through `get_mer_mmap`) on first access.  After outputs are
+    written `release_data` drops the binary and processed data of any event,
+    which are read and processed again if later accessed.  Pickled events hold
+    their binary (the .MER files are deleted once processed) but not processed
+    data already released, which is processed again from that binary on first
+    access after unpickling.
+
     '''
 
-    def __init__(self, mer_binary_name=None, mer_binary_header=None, mer_binary_binary=None, default_mer_environment=None):
+    def __init__(self, mer_binary_name=None, mer_binary_header=None, mer_binary_binary=None, default_mer_environment=None,
+                 mer_binary_source=None, mer_header=None):
         self.mer_binary_name = mer_binary_name
         self.mer_binary_header = mer_binary_header
+        # The attributes of `mer_binary_header`, tokenized (by `index_mer`, or here)
+        self.mer_header = mer_header if mer_header is not None else EventHeader(mer_binary_header)
+        self.mer_binary_source = mer_binary_source
         self.mer_binary_binary = mer_binary_binary
-        self.default_mer_environment = default_mer_environment
+        # The environment of the .MER file of the binary (a `MerEnvironment`,
+        # or its text), and its text
+        self.default_environment = MerEnvironment.of(default_mer_environment, mer_binary_name)
+        self.default_mer_environment = self.default_environment.text if self.default_environment else None
+        self._processed_data_released = False
         self.__version__ = version
 
         self.kstnm = None
@@ -179,6 +688,7 @@ class Event:
         self.kcmpnm = None
         self.mer_environment_name = None
         self.mer_environment = None
+        self.environment = None
 
         self.processed_data = None
         self.measured_fs = None
@@ -223,11 +733,11 @@ class Event:
 
         print("{} (binary)".format(self.mer_binary_name))
 
-        if len(re.findall(b" ROUNDS=(-?\d+)", self.mer_binary_header)) > 0 :
+        header = self.mer_header
+        if header.rounds is not None:
             self.is_stanford_event = True
-            self.stanford_rounds = re.findall(b" ROUNDS=(-?\d+)", self.mer_binary_header)[0]
-            date = re.findall(b" DATE=(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6})", mer_binary_header, re.DOTALL)
-            self.info_date = UTCDateTime.strptime(date[0].decode("utf-8","replace"), "%Y-%m-%dT%H:%M:%S.%f")
+            self.stanford_rounds = header.rounds
+            self.info_date = header.info_date
             self.is_requested = False
             #if len(re.findall("FNAME=(\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2}\.\d{6})", self.header))  0 :
             #self.requested = True
@@ -236,46 +746,104 @@ class Event:
             ## REQUIRES REFACTOR to add `.is_buffer` (raw buffer data/no time correction)
 
             self.is_stanford_event = False
-            self.scales = re.findall(b" STAGES=(-?\d+)", self.mer_binary_header)[0].decode("utf-8","replace")
-            catch_trig = re.findall(b" TRIG=(\d+)", self.mer_binary_header)
-            if len(catch_trig) > 0:
+            self.scales = str(header.stages)
+            if header.trig is not None:
                 # Event detected with STA/LTA algorithm
                 self.is_requested = False
-                self.trig = int(catch_trig[0])
+                self.trig = header.trig
 
                 # Sometimes "INFO DATE" is transferred with the incorrect precision,
                 # e.g., in 0039_5E71459C.MER, which is missing fractional seconds
                 # ("INFO DATE=2020-03-16T01:06:42")
-                date = re.findall(b" DATE=(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6})", mer_binary_header, re.DOTALL)
-                if not date:
+                if header.info_date is None:
                     return
 
                 # Potentially something like this, if we want to allow
                 # non-fractional seconds...
-                # date = re.findall(" DATE=(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6})", header, re.DOTALL)
-                # try:
-                #     self.date = UTCDateTime.strptime(date[0], "%Y-%m-%dT%H:%M:%S.%f")
-                # except IndexError as e:
-                #     date = re.findall(" DATE=(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})", header, re.DOTALL)
-                #     self.date = UTCDateTime.strptime(date[0], "%Y-%m-%dT%H:%M:%S")
+                # self.info_date = header.info_date or header.info_date_s
 
                 # The "depth" of an event is actually units of dbar in both .LOG and .MER
                 # (not mbar, like other pressures in the .LOG)
                 # We assume 1 dbar = 1 m = 100 mbar
                 # (NOT 1 m = 101 mbar as stated in MERMAID manual Réf : 452.000.852 Version 00)
-                self.pressure_dbar = int(re.findall(b" PRESSURE=(-?\d+)", self.mer_binary_header)[0])
+                self.pressure_dbar = int(header.pressure)
                 self.pressure_mbar = self.pressure_dbar * 100
-                self.info_date = UTCDateTime.strptime(date[0].decode("utf-8","replace"), "%Y-%m-%dT%H:%M:%S.%f")
+                self.info_date = header.info_date
                 self.depth = self.pressure_dbar # ~= meters
-                self.temperature = int(re.findall(b" TEMPERATURE=(-?\d+)", self.mer_binary_header)[0])
-                self.criterion = float(re.findall(b" CRITERION=(\d+\.\d+)", self.mer_binary_header)[0])
-                self.snr = float(re.findall(b" SNR=(\d+\.\d+)", self.mer_binary_header)[0])
+                self.temperature = int(header.temperature)
+                self.criterion = header.criterion
+                self.snr = header.snr
 
             else:
                 # Event requested by user
                 self.is_requested = True
-                date = re.findall(b" DATE=(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})", mer_binary_header, re.DOTALL)
-                self.info_date = UTCDateTime.strptime(date[0].decode("utf-8","replace"), "%Y-%m-%dT%H:%M:%S")
+                self.info_date = header.info_date_s
+
+    @property
+    def mer_binary_binary(self):
+        if self._mer_binary_binary is None and self.mer_binary_source is not None:
+            mer_file, offset, length = self.mer_binary_source
+            self._mer_binary_binary = get_mer_mmap(mer_file)[offset:offset+length]
+
+        return self._mer_binary_binary
+
+    @mer_binary_binary.setter
+    def mer_binary_binary(self, mer_binary_binary):
+        self._mer_binary_binary = mer_binary_binary
+
+    @property
+    def processed_data(self):
+        # Process again data dropped by `release_data`
+        if self._processed_data is None and self._processed_data_released:
+            self.set_processed_data()
+
+        return self._processed_data
+
+    @processed_data.setter
+    def processed_data(self, processed_data):
+        self._processed_data = processed_data
+        self._processed_data_released = False
+
+    def release_data(self):
+        '''Drop the processed data and (if it may be read again from its .MER
+        file) the binary of this event, to free memory
+
+        '''
+        if self._processed_data is not None:
+            self._processed_data = None
+            self._processed_data_released = True
+
+        if self.mer_binary_source is not None:
+            self._mer_binary_binary = None
+
+    def __getstate__(self):
+        # Pickle as self-contained events, with the attribute names of previous
+        # versions: the binary of a lazy event is read from its .MER file (and
+        # so held in memory until the whole pickle is written), while released
+        # processed data is pickled as None and processed again on access
+        # after unpickling
+        state = self.__dict__.copy()
+        state["mer_binary_binary"] = state.pop("_mer_binary_binary")
+        state["processed_data"] = state.pop("_processed_data")
+        if state["mer_binary_binary"] is None and self.mer_binary_source is not None:
+            mer_file, offset, length = self.mer_binary_source
+            state["mer_binary_binary"] = get_mer_mmap(mer_file)[offset:offset+length]
+        state["mer_binary_source"] = None
+
+        return state
+
+    def __setstate__(self, state):
+        # Accept pickles of previous versions, which lack these attributes
+        state.setdefault("mer_binary_source", None)
+        state.setdefault("_processed_data_released", False)
+        if "environment" not in state:
+            state["environment"] = MerEnvironment.of(state.get("mer_environment"),
+                                                     state.get("mer_environment_name"))
+            state["default_environment"] = MerEnvironment.of(state.get("default_mer_environment"),
+                                                             state.get("mer_binary_name"))
+        state["_mer_binary_binary"] = state.pop("mer_binary_binary")
+        state["_processed_data"] = state.pop("processed_data")
+        self.__dict__.update(state)
 
     def set_kstnm_kinst(self, kstnm=None, kinst=None):
         '''Sets `kstnm` and `kinst` attrs using those station and instrument names
@@ -287,52 +855,25 @@ class Event:
         self.kinst = kinst
 
     def set_environment(self, mer_environment_name, mer_environment):
-        self.mer_environment_name = mer_environment_name
-        self.mer_environment = mer_environment
-
-        # Shouldn't these attrs remain `None` instead of `""` if not a
-        # Stanford float?
-        duration = re.findall("DURATION_h=(\d+)", self.mer_environment)
-        if len(duration) > 0:
-            self.stanford_duration = duration[0]
-        else :
-            self.stanford_duration = ""
-
-        period = re.findall("PROCESS_PERIOD_h=(\d+)", self.mer_environment)
-        if len(duration) > 0:
-            self.stanford_period = period[0]
-        else :
-            self.stanford_period = ""
+        '''Set the environment (a `MerEnvironment`, or its text) associated with
+        this event, and the Stanford PSD parameters it holds
 
-        win_len = re.findall("WINDOW_LEN=(\d+)", self.mer_environment)
-        if len(duration) > 0:
-            self.stanford_win_len = win_len[0]
-        else :
-            self.stanford_win_len = ""
-
-        win_type = re.findall("WINDOW_TYPE=(\w+)", self.mer_environment)
-        if len(duration) > 0:
-            self.stanford_win_type = win_type[0]
-        else :
-            self.stanford_win_type = ""
-
-        overlap = re.findall("OVERLAP_PERCENT=(\d+)", self.mer_environment)
-        if len(duration) > 0:
-            self.stanford_overlap = overlap[0]
-        else :
-            self.stanford_overlap = ""
+        '''
+        self.environment = MerEnvironment.of(mer_environment, mer_environment_name)
+        self.mer_environment_name = mer_environment_name
+        self.mer_environment = self.environment.text
 
-        db_offset = re.findall("dB_OFFSET=(\d+)", self.mer_environment)
-        if len(duration) > 0:
-            self.stanford_db_offset = db_offset[0]
-        else :
-            self.stanford_db_offset = ""
+        self.stanford_duration = self.environment.stanford_duration
+        self.stanford_period = self.environment.stanford_period
+        self.stanford_win_len = self.environment.stanford_win_len
+        self.stanford_win_type = self.environment.stanford_win_type
+        self.stanford_overlap = self.environment.stanford_overlap
+        self.stanford_db_offset = self.environment.stanford_db_offset
 
     def find_measured_sampling_frequency(self):
         # Get the frequency recorded in the .MER environment header
-        fs_catch = re.findall("TRUE_SAMPLE_FREQ FS_Hz=(\d+\.\d+)", self.mer_environment)
-        if fs_catch:
-            self.measured_fs = float(fs_catch[0])
+        if self.environment.measured_fs is not None:
+            self.measured_fs = self.environment.measured_fs
         else:
             return
 
@@ -382,15 +923,9 @@ class Event:
             # milliseconds could be introduced in the date of the requested
             # signal (and the error would be of several tenths of seconds by
             # considering the sampling frequency exactly equal to 40Hz)."
-            rec_file_date = re.findall(b"FNAME=(\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2})", self.mer_binary_header)
-            rec_file_date = UTCDateTime.strptime(rec_file_date[0].decode("utf-8","replace"), "%Y-%m-%dT%H_%M_%S")
-
-            rec_file_ms = re.findall(b"FNAME=\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2}\.?(\d{6}?)", self.mer_binary_header)
-            if len(rec_file_ms) > 0:
-                rec_file_date += float("0." + rec_file_ms[0].decode("utf-8","replace"))
-
-            sample_offset = re.findall(b"SMP_OFFSET=(\d+)", self.mer_binary_header)
-            sample_offset = float(sample_offset[0])
+            # (FNAME, to the microsecond if given, is the first sample of the file)
+            rec_file_date = self.mer_header.fname
+            sample_offset = float(self.mer_header.smp_offset)
             self.uncorrected_starttime = rec_file_date + sample_offset / self.measured_fs
         else:
             # For a detected event the INFO DATE is timestamp of the STA/LTA trigger
@@ -409,13 +944,35 @@ class Event:
             # Bumps and other matters," 28 Mar 2021.
             self.uncorrected_starttime = self.info_date - float(self.trig) / self.decimated_fs
 
-    def set_processed_data(self):
+    def set_icdf24_flavor(self):
+        '''Sets attrs `normalized` and `edges_correction`, the flavor of inverse
+        wavelet transform, from the .MER environment (only for V1 floats)
+
+        Raises:
+            ValueError: if the environment lacks NORMALIZED= or EDGES_CORRECTION=
+                        (the data cannot be processed without them)
+
+        '''
+        self.normalized = self.environment.normalized if self.environment else None
+        self.edges_correction = self.environment.edges_correction if self.environment else None
+        if self.normalized is None or self.edges_correction is None:
+            err_mess = "\nFailed: no NORMALIZED= and/or EDGES_CORRECTION= in .MER environment\n"
+            err_mess += "Using: event around {:s} in {:s}, environment of {:s}".format(str(self.info_date),
+                                                                                  str(self.mer_binary_name),
+                                                                                  str(self.mer_environment_name))
+            raise ValueError(err_mess)
+
+    def set_processed_data(self, processed_data=None):
         '''Convert raw .MER binary data to processed MERMAID traces or Stanford PSD
         50-95% arrays.  The former's binary are generally inverted via a
         CDF(2,4) wavelet transform for "WLT?" data (or through casting to int32
         in the case of "RAW" [STAGES=-1] data), while the latter's are simply
         cast to int8 and...
 
+        Optional `processed_data` is this event's already-inverted wavelet
+        transform (see `Events.set_processed_data`), in which case the inversion
+        is skipped.
+
         Sets attrs:
         `processed_data`          (for V1 floats and V2 Stanford PSD floats)
         `data_max`                (for V1 floats and V2 Stanford PSD floats)
@@ -457,80 +1014,32 @@ class Event:
         else:
             # Get additional information on flavor of invert wavelet transform
             # Must do this before the `return` statement, in the case of RAW files
-            self.normalized = re.findall(" NORMALIZED=(\d+)", self.mer_environment)[0]
-            self.edges_correction = re.findall(" EDGES_CORRECTION=(\d+)", self.mer_environment)[0]
+            self.set_icdf24_flavor()
 
             # If scales == -1 this is a raw signal, just convert binary data to np array of int32
-            if self.scales != "-1":
-                # Change to bin/ directory because the executable C inversion
-                # program called below can fail with full paths :(
-                os.chdir("bin")
-
-                # The following scripts READ wavelet coefficients (what MERMAID
-                # generally sends) from a file named "wtcoeffs" and WRITE the inverted
-                # data to a file name, e.g., "wtcoeffs.icdf24_5"
-                wtcoeffs_data_file_name = "wtcoeffs"
-                inverted_data_file_name = "wtcoeffs.icdf24_" + self.scales
-
-                # Delete any previously-inverted data just to be absolutely sure we are
-                # working with this event's data only (an interruption before the second
-                # call to delete these files could result in their persistence)
-                if os.path.exists(wtcoeffs_data_file_name):
-                    os.remove(wtcoeffs_data_file_name)
-
-                if os.path.exists(inverted_data_file_name):
-                    os.remove(inverted_data_file_name)
-
-                # Write cdf24 data to file named "wtcoeffs" in local directory
-                with open(wtcoeffs_data_file_name, 'wb') as f:
-                    f.write(self.mer_binary_binary)
-
-                # The inverse wavelet transform C code (`icdf24_v103(ec)_test`) is
-                # called below in a shell subprocess and its output is verified;
-                # determine if edge correction needs to be accounted for and set the
-                # first argument (the executable) in the full command (note that "./" is
-                # required before script on JDS' Linux machine, but not JDS' Mac...)
-                icdf24_shell_command = []
-                if self.edges_correction == "1":
-                    icdf24_shell_command.append("./icdf24_v103ec_test")
-
+            if processed_data is not None:
+                self.processed_data = processed_data
+
+            elif self.scales != "-1":
+                # Perform the inverse wavelet transform in memory (or with the
+                # C executables in bin/, if so requested with MERMAID_ICDF24)
+                if icdf24_method == "subprocess":
+                    invert = icdf24.icdf24_subprocess
                 else:
-                    icdf24_shell_command.append("./icdf24_v103_test")
-
-                # Append the argument list to feed inversion script, e.g., "5 1 wtcoeffs"
-                icdf24_shell_command.extend([self.scales, self.normalized, wtcoeffs_data_file_name])
+                    invert = icdf24.icdf24
 
-                # Perform inverse wavelet transform, e.g., running in background shell --
-                # $ ./icdf24_v103ec_test 5 1 wtcoeffs
-                # NB, `subprocess` is analogous to `system` in MATLAB
-                stdout = subprocess.check_output(icdf24_shell_command)
-
-                # Ensure the inverse wavelet transform worked as expected, meaning that
-                # it generated an output file of int32 data
-                if not os.path.exists(inverted_data_file_name):
-                    cmd = ' '.join(map(str, icdf24_shell_command))
+                try:
+                    self.processed_data = invert(self.mer_binary_binary, self.scales,
+                                                 self.normalized, self.edges_correction)
+                except ValueError as e:
                     err_mess = "\nFailed: inverse wavelet transformation\n"
-                    err_mess += "In directory: {:s}\n".format(bin_path)
-                    err_mess += "Attempted command: {:s}\n".format(cmd)
-                    err_mess += "Using: event around {:s} in {:s}\n\n".format(self.info_date, self.mer_binary_name)
-                    err_mess += "Command printout:\n'{:s}'".format(stdout)
+                    err_mess += "Using: event around {:s} in {:s}\n".format(str(self.info_date), self.mer_binary_name)
+                    err_mess += str(e)
 
                     # This output message is more helpful than the program crashing on
                     # the next line
                     sys.exit(err_mess)
 
-                # Read the inverted data
-                self.processed_data = np.fromfile(inverted_data_file_name, np.int32)
-
-                # Delete the files of coefficient and inverted data, otherwise a latter
-                # .MER with an incomplete binary event block can come along and use the
-                # same data
-                os.remove(wtcoeffs_data_file_name)
-                os.remove(inverted_data_file_name)
-
-                # Move up one level back into the scripts/ directory
-                os.chdir("..")
-
             else:
                 self.processed_data = np.frombuffer(self.mer_binary_binary, np.int32)
 
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+#
+# Part of automaid -- a Python package to process MERMAID files
+# pymaid environment (Python v3.10)
+#
+# NumPy port of the inverse CDF(2,4) wavelet transform written by Osean
+# (jf.argentino@osean.fr) in $AUTOMAID/scripts/src/V103/icdf24.c (no edge
+# correction) and $AUTOMAID/scripts/src/V103EC/icdf24.c (edge correction)
+
+import os
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+import concurrent.futures
+
+# Executables `icdf24_v103_test` and `icdf24_v103ec_test` (see bin/README.md)
+bin_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin")
+
+# SQRT(2) = 239 / 169, and the lifting constants (Ua = [-3 19 19 -3] / 64)
+SQRT2_NUM = 239
+SQRT2_DEN = 169
+A = 3
+B = 19
+C = 64
+
+def _wrap(x):
+    '''Wrap int64 values to the int32 range, as the C code does (silently) on
+    overflow of its int32_t arithmetic
+
+    '''
+    return ((x + 2**31) % 2**32) - 2**31
+
+def _cdiv(x, den):
+    '''C integer division (truncation toward zero) by positive `den`
+
+    '''
+    return np.where(x < 0, -(-x // den), x // den)
+
+def _cmod(x, den):
+    '''C remainder (sign of the dividend) of division by positive `den`
+
+    '''
+    return x - _cdiv(x, den) * den
+
+def _long_mult_and_div(x, num, den):
+    '''Return x * num / den as computed by the default (neither PARANOID nor
+    LAZY) `long_mult_and_div` of long_ops.c
+
+    '''
+    neg = x < 0
+    rem = np.where(neg, _cmod(_wrap(-x), den), _cmod(x, den))
+    frac = _cdiv(num * rem, den)
+    prod = _cdiv(x, den) * num
+    return _wrap(np.where(neg, prod - frac, prod + frac))
+
+def _inverse_round(x, lx, edges_correction):
+    '''Undo one scale: the approximation (`x[:lx]`) and detail (`x[lx:2*lx]`)
+    coefficients are merged and interleaved into `x[:2*lx]`, in place
+
+    '''
+    a = x[..., :lx]
+    d = x[..., lx:2*lx]
+
+    # Approximation part
+    if edges_correction:
+        # Haar transform
+        a[..., 0] = _wrap(a[..., 0] - _long_mult_and_div(d[..., 0], 1, 2))
+        if lx > 1:
+            # cdf(2,2)
+            a[..., 1] = _wrap(a[..., 1] - _long_mult_and_div(_wrap(d[..., 0] + d[..., 1]), 1, 4))
+
+    if lx > 3:
+        a[..., 2:lx-1] = _wrap(a[..., 2:lx-1] + _long_mult_and_div(_wrap(d[..., 0:lx-3] + d[..., 3:lx]), A, C))
+        a[..., 2:lx-1] = _wrap(a[..., 2:lx-1] - _long_mult_and_div(_wrap(d[..., 1:lx-2] + d[..., 2:lx-1]), B, C))
+
+    if edges_correction and lx > 2:
+        # cdf(2,2)
+        a[..., lx-1] = _wrap(a[..., lx-1] - _long_mult_and_div(_wrap(d[..., lx-1] + d[..., lx-2]), 1, 4))
+
+    # Detail part
+    d[..., :lx-1] = _wrap(d[..., :lx-1] + _cdiv(_wrap(a[..., :lx-1] + a[..., 1:lx]), 2))
+    if edges_correction:
+        # Haar transform
+        d[..., lx-1] = _wrap(d[..., lx-1] + a[..., lx-1])
+
+    # Resort: a[0] d[0] a[1] d[1] ...
+    x[..., :2*lx] = np.stack((a, d), axis=-1).reshape(x.shape[:-1] + (2*lx,))
+
+def _icdf24(x, K, normalized, edges_correction):
+    '''Invert, in place, the last axis of int64 array `x` holding int32 wavelet
+    coefficients (see `icdf24`)
+
+    '''
+    lx = x.shape[-1] >> K
+
+    # Normalization by SQRT(2); V103 divides the full signal by SQRT(2) 6-K
+    # times before inverting, V103EC after
+    if normalized == 1 and not edges_correction:
+        for i in range(6-K):
+            x[...] = _long_mult_and_div(x, SQRT2_DEN, SQRT2_NUM)
+
+    for q in range(K):
+        if normalized == 1:
+            x[..., :lx] = _long_mult_and_div(x[..., :lx], SQRT2_DEN, SQRT2_NUM)
+            x[..., lx:2*lx] = _long_mult_and_div(x[..., lx:2*lx], SQRT2_NUM, SQRT2_DEN)
+
+        elif normalized == 2:
+            # Approximation divided by 2 on even rounds, detail multiplied by
+            # SQRT(2) on odd rounds
+            if q % 2 == 0:
+                x[..., :lx] >>= 1
+            else:
+                x[..., lx:2*lx] = _long_mult_and_div(x[..., lx:2*lx], SQRT2_NUM, SQRT2_DEN)
+
+        _inverse_round(x, lx, edges_correction)
+        lx <<= 1
+
+    if normalized == 1 and edges_correction:
+        for i in range(6-K):
+            x[...] = _long_mult_and_div(x, SQRT2_DEN, SQRT2_NUM)
+
+    elif normalized == 2 and K % 2:
+        x[...] = _long_mult_and_div(x, SQRT2_NUM, SQRT2_DEN)
+
+def _parse_flavor(scales, normalized, edges_correction):
+    '''Return (K, normalized, edges_correction) as ints, interpreted as the
+    command-line arguments of `icdf24_v103(ec)_test` are
+
+    '''
+    # (the flavor is read from the .MER environment; never default it)
+    if normalized is None or edges_correction is None:
+        raise ValueError("Unknown flavor: normalized={}, edges_correction={}".format(normalized, edges_correction))
+
+    K = int(scales)
+    normalized = str(normalized)
+    normalized = int(normalized) if normalized in ("0", "1") else 2
+    edges_correction = str(edges_correction) == "1"
+    return K, normalized, edges_correction
+
+def icdf24(mer_binary_binary, scales, normalized, edges_correction):
+    '''Return the inverse CDF(2,4) wavelet transform of .MER event binary as an
+    int32 ndarray, bit-identical to the output of the C executables
+
+    Args:
+        mer_binary_binary (bytes): int32 wavelet coefficients (`Event.mer_binary_binary`)
+        scales (str/int): Number of wavelet scales ("STAGES=" in the event header)
+        normalized (str/int): "NORMALIZED=" in the .MER environment
+        edges_correction (str/int): "EDGES_CORRECTION=" in the .MER environment;
+                                    "1" mimics `icdf24_v103ec_test`, else `icdf24_v103_test`
+
+    Raises:
+        ValueError: if the number of coefficients is not a multiple of 2^scales
+
+    '''
+    return icdf24_batch([mer_binary_binary], scales, normalized, edges_correction)[0]
+
+def icdf24_batch(mer_binary_binaries, scales, normalized, edges_correction):
+    '''Return the inverse CDF(2,4) wavelet transforms of several .MER event
+    binaries that share the same flavor and length, stacked as the rows of a
+    2-D int32 ndarray and inverted in a single vectorized pass
+
+    Args:
+        mer_binary_binaries (list): Equal-length int32 wavelet coefficients (bytes)
+        scales, normalized, edges_correction: See `icdf24`
+
+    Raises:
+        ValueError: if the binaries differ in length, or if their number of
+                    coefficients is not a multiple of 2^scales
+
+    '''
+    K, normalized, edges_correction = _parse_flavor(scales, normalized, edges_correction)
+
+    nbytes = {len(mer_binary_binary) for mer_binary_binary in mer_binary_binaries}
+    if len(nbytes) != 1:
+        raise ValueError("Cannot batch wavelet coefficients of differing lengths")
+
+    # Like `fread` in icdf24_test.c any trailing partial int32 is ignored
+    nbytes = nbytes.pop()
+    nbytes -= nbytes % 4
+    x = np.frombuffer(b"".join(b[:nbytes] for b in mer_binary_binaries), np.int32)
+    x = x.reshape(len(mer_binary_binaries), nbytes // 4).astype(np.int64)
+
+    if x.shape[-1] == 0 or x.shape[-1] % (1 << K):
+        raise ValueError("{:d} not a valid size for {:d} scales".format(x.shape[-1], K))
+
+    _icdf24(x, K, normalized, edges_correction)
+    return x.astype(np.int32)
+
+def icdf24_subprocess(mer_binary_binary, scales, normalized, edges_correction):
+    '''Same as `icdf24`, but performed by the C executables in bin/ (the
+    original implementation, retained for comparison)
+
+    '''
+    # The following scripts READ wavelet coefficients (what MERMAID
+    # generally sends) from a file named "wtcoeffs" and WRITE the inverted
+    # data to a file name, e.g., "wtcoeffs.icdf24_5"; the executables are run
+    # from a private scratch directory (never the CWD, which is left untouched)
+    # with relative file names because they can fail with full paths (the
+    # output file name is limited to 32 characters), so that concurrent
+    # inversions (and automaid instances) do not overwrite each other's files
+    wtcoeffs_data_file_name = "wtcoeffs"
+    inverted_data_file_name = "wtcoeffs.icdf24_" + str(scales)
+    scratch_path = tempfile.mkdtemp(prefix="icdf24_")
+    wtcoeffs_data_file_path = os.path.join(scratch_path, wtcoeffs_data_file_name)
+    inverted_data_file_path = os.path.join(scratch_path, inverted_data_file_name)
+
+    # Determine if edge correction needs to be accounted for and set the first
+    # argument (the executable) in the full command
+    icdf24_shell_command = []
+    if str(edges_correction) == "1":
+        icdf24_shell_command.append(os.path.join(bin_path, "icdf24_v103ec_test"))
+
+    else:
+        icdf24_shell_command.append(os.path.join(bin_path, "icdf24_v103_test"))
+
+    # Append the argument list to feed inversion script, e.g., "5 1 wtcoeffs"
+    icdf24_shell_command.extend([str(scales), str(normalized), wtcoeffs_data_file_name])
+
+    # The scratch directory (and the files of coefficient and inverted data
+    # within) is deleted no matter what, so that a latter .MER with an
+    # incomplete binary event block cannot come along and use the same data
+    try:
+        # Write cdf24 data to file named "wtcoeffs" in the scratch directory
+        with open(wtcoeffs_data_file_path, 'wb') as f:
+            f.write(mer_binary_binary)
+
+        # Perform inverse wavelet transform, e.g., running in background shell --
+        # $ $AUTOMAID/scripts/bin/icdf24_v103ec_test 5 1 wtcoeffs
+        stdout = subprocess.check_output(icdf24_shell_command, cwd=scratch_path)
+
+        # Ensure the inverse wavelet transform worked as expected, meaning that
+        # it generated an output file of int32 data
+        if not os.path.exists(inverted_data_file_path):
+            err_mess = "In directory: {:s}\n".format(scratch_path)
+            err_mess += "Attempted command: {:s}\n".format(' '.join(icdf24_shell_command))
+            err_mess += "Command printout:\n'{:s}'".format(stdout.decode("utf-8", "replace"))
+            raise ValueError(err_mess)
+
+        # Read the inverted data
+        processed_data = np.fromfile(inverted_data_file_path, np.int32)
+
+    finally:
+        shutil.rmtree(scratch_path, ignore_errors=True)
+
+    return processed_data
+
+def _cpu_time():
+    '''Return the CPU time of this process and of its terminated children (the
+    C executables, with `icdf24_subprocess`), in seconds
+
+    '''
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def _invert_batch(args):
+    '''Worker of `icdf24_parallel`: return the list of inverted traces of one
+    batch, or the ValueError raised in inverting it, and the CPU time (s) spent
+
+    '''
+    mer_binary_binaries, scales, normalized, edges_correction, method = args
+    cpu_s = _cpu_time()
+    try:
+        if method == "subprocess":
+            result = [icdf24_subprocess(mer_binary_binary, scales, normalized, edges_correction)
+                      for mer_binary_binary in mer_binary_binaries]
+
+        else:
+            result = list(icdf24_batch(mer_binary_binaries, scales, normalized, edges_correction))
+
+    except ValueError as e:
+        result = e
+
+    return result, _cpu_time() - cpu_s
+
+def icdf24_parallel(batches, workers=1, method="numpy", executor=None):
+    '''Invert several batches of wavelet coefficients, fanned out to a pool of
+    `workers` processes (serially, in this process, if `workers` is 1)
+
+    Each batch is split into (up to) `workers` chunks, so that even the one or
+    two batches of a single cycle keep every worker busy.
+
+    Args:
+        batches (list): (mer_binary_binaries, scales, normalized, edges_correction)
+                        tuples, each inverted with `icdf24_batch` (or one at a
+                        time with `icdf24_subprocess` if `method` is "subprocess")
+        workers (int): Number of worker processes; 0 or None to use all CPUs
+        method (str): "numpy" (def) or "subprocess"
+        executor (concurrent.futures.Executor): Pool of `workers` processes
+                                                reused across calls (def: one
+                                                is created for this call only)
+
+    Returns:
+        list: One item per batch, in the order of `batches` -- the list of
+              inverted traces (int32 ndarrays) of that batch, or the ValueError
+              raised in inverting it
+        float: CPU time (s) spent by the processes of `executor`, which, alive
+               after this call, `os.times` of this process does not count yet
+               (0 if inverted in this process, or by a pool created and so
+               terminated within this call)
+
+    '''
+    args = [tuple(batch) + (method,) for batch in batches]
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    n_binaries = sum(len(arg[0]) for arg in args)
+    if workers <= 1 or n_binaries <= 1:
+        return [_invert_batch(arg)[0] for arg in args], 0.0
+
+    if executor is None:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, n_binaries)) as executor:
+            return icdf24_parallel(batches, workers, method, executor)[0], 0.0
+
+    # Split the batches into chunks, and put the chunks of each batch back together
+    chunks = []
+    for i, arg in enumerate(args):
+        size = -(-len(arg[0]) // workers)
+        for j in range(0, len(arg[0]), size):
+            chunks.append((i, (arg[0][j:j+size],) + arg[1:]))
+
+    results = [[] for arg in args]
+    cpu_s = 0.0
+    for (i, chunk), (result, chunk_cpu_s) in zip(chunks, executor.map(_invert_batch, [chunk for i, chunk in chunks])):
+        cpu_s += chunk_cpu_s
+        if isinstance(results[i], ValueError):
+            continue
+
+        if isinstance(result, ValueError):
+            results[i] = result
+        else:
+            results[i].extend(result)
+
+    return results, cpu_s
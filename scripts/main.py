@@ -11,6 +11,7 @@
 # Developer: Joel D. Simon (JDS) <jdsimon@bathymetrix.com>
 # Last modified: 29-Jun-2026
 
+import io
 import os
 import re
 import glob
@@ -20,27 +21,31 @@ import argparse
 import datetime
 import functools
 import pickle
+import json
+import traceback
+import contextlib
+import concurrent.futures
 
 import kml
 import gps
+import cache
 import setup
 import cycles
 import utils
 import events
 import vitals
 import geocsv
+import staging
+import timings
 import preprocess
 import sbe41
 import sbe61
 import rbr
 
-## !!! TEMP VARS !! ##
-csv_file = True
-## !!! TEMP VARS !! ##
-
 # Log a creation date for metadata files in ISO 8601, milliseconds precision,
 # with "Z" suffix for UTC: "YYYY-MM-DDTHH:MM:SS.sssZ"
 creation_datestr = datetime.datetime.now(pytz.UTC).isoformat()[:23] + "Z"
+creation_date = datetime.datetime.utcnow()
 
 # Get current version number.
 version = setup.get_version()
@@ -68,6 +73,24 @@ def_mermaid_path = os.environ["MERMAID"]
 def_server_path = os.path.join(def_mermaid_path, "server")
 def_processed_path = os.path.join(def_mermaid_path, "processed")
 def_database_path = os.path.join(def_mermaid_path, "database")
+def_cache_path = os.path.join(def_mermaid_path, "cache")
+
+# Outputs that may be written (select with `--outputs` and `--skip`):
+#   sac, mseed, mhpsd:        event traces (and Stanford PSDs) of each cycle
+#   png, html:                event plots (take heaps of memory)
+#   cycle_html, cycle_csv:    dive plot and depths of each cycle
+#   profile_html, profile_csv: CTD profiles (S41, S61, RBR) of each cycle
+#   kml:                      Google Earth file of each float
+#   vitals:                   vital-data plots of each float, and the corrected
+#                             external pressures of the last cycle of every float
+#   txt:                      GPS, interpolation, .LOG/.CYCLE, trace, location
+#                             and ObsPy-stats text and csv files of each float
+#   geocsv:                   GeoCSV metadata of each float
+all_outputs = ("sac", "mseed", "mhpsd", "png", "html", "cycle_html", "cycle_csv",
+               "profile_html", "profile_csv", "kml", "vitals", "txt", "geocsv")
+
+# Outputs written by default (all but the event plots)
+def_outputs = tuple(o for o in all_outputs if o not in ("png", "html"))
 
 # Parse (optional) command line inputs to override default paths
 parser = argparse.ArgumentParser()
@@ -91,27 +114,116 @@ parser.add_argument('-d',
                     dest='database',
                     #metavar='',
                     help="database directory (default: {:s})".format(def_database_path))
+parser.add_argument('-c',
+                    '--cache',
+                    default=def_cache_path,
+                    dest='cache',
+                    #metavar='',
+                    help="cache directory (default: {:s})".format(def_cache_path))
+parser.add_argument('--offline',
+                    action='store_true',
+                    dest='offline',
+                    help="use the databases in the database directory, without updating them")
+parser.add_argument('-j',
+                    '--jobs',
+                    default=1,
+                    type=int,
+                    dest='jobs',
+                    help="number of floats processed in parallel (0: one per CPU; default: 1)")
+parser.add_argument('--profile',
+                    default=os.environ.get("MERMAID_PROFILE", ""),
+                    dest='profile',
+                    metavar='STAGES',
+                    help="comma-separated stages (see timings.json) to profile with cProfile, or \"all\" "
+                    "(default: $MERMAID_PROFILE, if set)")
+parser.add_argument('--profile-floats',
+                    default=os.environ.get("MERMAID_PROFILE_FLOATS", ""),
+                    dest='profile_floats',
+                    metavar='FLOATS',
+                    help="comma-separated floats to profile (default: $MERMAID_PROFILE_FLOATS, if set, else all)")
+parser.add_argument('--profile-top',
+                    default=int(os.environ.get("MERMAID_PROFILE_TOP", 0)),
+                    type=int,
+                    dest='profile_top',
+                    metavar='N',
+                    help="only write the N functions of largest cumulative time of each profile, as text "
+                    "(default: $MERMAID_PROFILE_TOP, if set, else full .pstats files)")
+parser.add_argument('-o',
+                    '--outputs',
+                    default=os.environ.get("MERMAID_OUTPUTS", "default"),
+                    dest='outputs',
+                    metavar='OUTPUTS',
+                    help="comma-separated outputs to write, among: {:s}; or \"default\" (all but png,html) "
+                    "or \"all\" (default: $MERMAID_OUTPUTS, if set, else \"default\")".format(",".join(all_outputs)))
+parser.add_argument('--skip',
+                    default="",
+                    dest='skip',
+                    metavar='OUTPUTS',
+                    help="comma-separated outputs not to write (e.g., --skip kml,vitals)")
+parser.add_argument('--redo',
+                    action='store_true',
+                    dest='redo',
+                    help="delete the processed directory of every float and process it anew")
+parser.add_argument('--princeton-only',
+                    action='store_true',
+                    dest='princeton_only',
+                    help="only process the Princeton floats")
 args = parser.parse_args()
+
+def parse_outputs(string):
+    '''Return the set of outputs listed in comma-separated `string`, where
+    "default" and "all" stand for `def_outputs` and `all_outputs`
+
+    '''
+    outputs = set()
+    for output in string.split(","):
+        output = output.strip()
+        if output == "default":
+            outputs.update(def_outputs)
+        elif output == "all":
+            outputs.update(all_outputs)
+        elif output in all_outputs:
+            outputs.add(output)
+        elif output:
+            parser.error("unknown output \"{:s}\" (choose from: {:s})".format(output, ",".join(all_outputs)))
+
+    return outputs
+
 server_path = os.path.abspath(args.server)
 processed_path = os.path.abspath(args.processed)
 database_path = os.path.abspath(args.database)
+cache_path = os.path.abspath(args.cache)
+offline = args.offline
+jobs = args.jobs
+profile_stages = {stage for stage in args.profile.split(",") if stage}
+profile_floats = {mfloat for mfloat in args.profile_floats.split(",") if mfloat}
+profile_top = args.profile_top
+outputs = parse_outputs(args.outputs) - parse_outputs(args.skip)
 
 # Set an inclusive time range of analysis for a specific float
 # (by default, deployment to present...adjust here or there)
 filterDate = utils.deploy2present()
 
 # Boolean set to true in order to delete every processed data and redo everything
-redo = False
+redo = args.redo
 
 # Filter to only run Princeton set.
-princeton_only = False
-
-# Figures commented by default (take heaps of memory)
-write_png = False
-write_html = False
-write_sac = True
-write_mseed = True
-write_mhpsd = True
+princeton_only = args.princeton_only
+
+# Outputs to write (see `all_outputs`); those not selected are skipped entirely
+write_png = "png" in outputs
+write_html = "html" in outputs
+write_sac = "sac" in outputs
+write_mseed = "mseed" in outputs
+write_mhpsd = "mhpsd" in outputs
+write_cycle_html = "cycle_html" in outputs
+write_cycle_csv = "cycle_csv" in outputs
+write_profile_html = "profile_html" in outputs
+write_profile_csv = "profile_csv" in outputs
+write_kml = "kml" in outputs
+write_vitals = "vitals" in outputs
+write_txt = "txt" in outputs
+write_geocsv = "geocsv" in outputs
 
 # Use WebGL implementation of graph to
 # increase speed, improve interactivity, and the ability to plot even more data
@@ -122,6 +234,54 @@ optimized_html = True
 # but the file size will be reduced considerably
 local_html = True
 
+# Read event binary from the .MER files on demand (memory mapped), and release
+# binary and processed data once a cycle's outputs are written, to bound memory
+lazy_event_data = True
+
+# Cache inverted wavelet transforms across runs (in `cache_path`), so that events
+# unchanged since the last run (or retransmitted) are not inverted again
+cache_icdf24 = True
+
+# Cache the parsed environment and event headers and offsets of .MER files
+# across runs (in `cache_path`), so that only new .MER files are parsed
+cache_mer_index = True
+
+# Number of processes decrypting the .BIN files of each float (0: one per CPU)
+decrypt_workers = 0
+
+# Keep decrypted .LOG files, and a manifest of their .BIN files, in a hidden
+# ".decrypted" directory of each float's processed directory, so that .BIN
+# files unchanged since the last run are not decrypted again
+reuse_decrypted_bins = True
+
+# Keep complete .CYCLE files, and a checkpoint of the last complete cycle, in a
+# hidden ".cycles" directory of each float's processed directory, so that only
+# the cycles following it are converted again from .LOG files
+resume_cycle_conversion = True
+
+# Stage server files into processed directories by "reflink", "hardlink",
+# "symlink", or "copy"; "auto" tries reflink, then hardlink, then copy
+stage_method = "auto"
+
+# Record the wall time, CPU time, peak memory and item counts of each stage of
+# each float in "timings.json" in `processed_path` (and print a summary)
+record_timings = True
+print_timings = False
+
+# Skip floats whose server files are unchanged since they were last processed
+# (according to a manifest, ".server_manifest.json", in their processed directory)
+skip_unchanged_floats = True
+
+# Seconds after a successful database update during which the database server
+# is not queried again (0: query at every run; see also `--offline`)
+database_ttl = 24 * 3600
+
+# Persist the compiled .BIN decrypt databases as pickles in `database_path`
+pickle_decrypt_databases = True
+
+# Maximum size of each cache, in bytes (least-recently-used entries are evicted)
+cache_max_bytes = 2 * 2**30
+
 # Dictionary to write last-cycle vital data to output files
 lastcycle = {}
 
@@ -143,201 +303,309 @@ def sort_mfloats(a,b):
     nbB = int(buoy_nbB,10)
     return nbA - nbB
 
-def main():
-    # Set working directory in "scripts"
-    os.chdir(scripts_path)
-
-    # Create processed directory if it doesn't exist
-    if not os.path.exists(processed_path):
-        os.mkdir(processed_path)
-
-    # Search MERMAID floats
-    vitfile_path = os.path.join(server_path, "[0-9]*.*-*-*[0-9].vit")
-    mfloats = [p.split("/")[-1][:-4] for p in glob.glob(vitfile_path)]
-
-    # Create database directory if it doesn't exist
-    if not os.path.exists(database_path):
-        os.mkdir(database_path)
-
-    # Update Database
-    preprocess.database_update(database_path)
-
-    # Sort *.vit path
-    mfloats_sorted = sorted(mfloats, key=functools.cmp_to_key(sort_mfloats))
-
-    # For each MERMAID float
-    for mfloat in mfloats_sorted:
-        if princeton_only:
-            if mfloat not in utils.princeton_mermaids():
-                continue
-
-        print("Processing {:s} .LOG & .MER files...".format(mfloat))
-
-        # Set the path for the float
-        mfloat_path = os.path.join(processed_path, mfloat, "")
-
-        # Get float number
-        mfloat_nb = re.findall("(\d+)$", mfloat)[0]
-
-        # Delete the directory if the redo flag is true
-        if redo and os.path.exists(mfloat_path):
-            shutil.rmtree(mfloat_path)
-
-        # Create directory for the float
-        if not os.path.exists(mfloat_path):
-            os.mkdir(mfloat_path)
-
-        # Remove existing files in the processed directory (the script may have been previously
-        # executed, copied the files, then failed)
-        for f in glob.glob(mfloat_path + "*.*"):
-            os.remove(f)
-
-        # Copy appropriate files in the directory and remove files outside of the time range
-        files_to_copy = []
-
-        # All files begin with buoy_nb followed by underscore
-        # Add underscore avoids errors between similar buoy numbers (Ex: 01_* and 0101_*)
-        files_to_copy += glob.glob(os.path.join(server_path, mfloat_nb +  "_*"))
-
-        # Add .cmd, .out, and .vit files
-        files_to_copy += glob.glob(os.path.join(server_path, mfloat + "*"))
-
-        # Copy files
-        for f in files_to_copy:
-            shutil.copy(f, mfloat_path)
-
-        # Concatenate all files for this float
-        preprocess.concatenate_files(mfloat_path);
-
-        # Decrypt all files for this float
-        preprocess.decrypt_all(mfloat_path);
-
-        # Determine the time range of analysis (generally; birth to death of a MERMAID)
-        if mfloat in filterDate.keys():
-            begin = filterDate[mfloat][0]
-            end = filterDate[mfloat][1]
-        else:
-            begin = datetime.datetime(1000, 1, 1)
-            end = datetime.datetime(3000, 1, 1)
-
-        # Convert in cycle files
-        preprocess.convert_in_cycle(mfloat_path,begin,end);
-
-        # Really: collect all the .MER files (next we correlate their environments to .LOG files)
-        print(" ...compiling a list of events from {:s} .MER files (GPS & seismic data)..." \
-              .format(mfloat))
-        mevents = events.Events(mfloat_path)
-        # Build list of all S41 profiles recorded
-        ms41s = sbe41.Profiles(mfloat_path)
-        # Build list of all S61 profiles recorded
-        ms61s = sbe61.Profiles(mfloat_path)
-
-        # Concatenate RBR files
-        preprocess.concatenate_rbr_files(mfloat_path);
-        # Build list of all RBR profiles recorded
-        mRBRs = rbr.Profiles(mfloat_path)
-
-        # Collect all the .CYCLE files
-        print(" ...matching those events to {:s} .LOG ('dive') files (GPS & dive metadata)..." \
-              .format(mfloat))
-        cycle_logs = cycles.get_cycles(mfloat_path, mevents, ms41s, ms61s, mRBRs)
-
-        # Verify dive logs are sorted as expected
-        if cycle_logs!= sorted(cycle_logs, key=lambda x: x.start_date):
-            raise ValueError('`cycle_logs` improperly sorted')
-
-        for i, cycle_log in enumerate(cycle_logs):
-            # Create the directory
-            if not os.path.exists(cycle_log.processed_path):
-                os.mkdir(cycle_log.processed_path)
-
-            # Reformat and write .LOG in individual dive directory
-            cycle_log.write_datetime_cycle()
-
-            # Write .MER environment in individual directories
-            cycle_log.write_mermaid_environment_files()
-
-            # Write .S41 environment in individual directories
-            cycle_log.write_s41_environment_file();
-
-            # Write .S61 environment in individual directories
-            cycle_log.write_s61_environment_file();
-
-            # Generate dive plot
-            cycle_log.write_cycle_html(csv_file,optimize=optimized_html,include_plotly=local_html)
-            # <-- timestamps not corrected for clockdrift
-
-            # The GPS list is None outside of requested begin/end dates, within
-            # which it defaults to an empty list if it is truly empty
-            if cycle_log.gps_list is None:
-                continue
-
-            # Validate that the GPS may be used to correct various MERMAID
-            # timestamps, including diving/surfacing and event starttimes
-            cycle_log.validate_gps(min_gps_fix, max_gps_time)
-
-            # Apply clock corrections to the events associated with this
-            # completed dive
-            cycle_log.correct_clockdrifts()
-
-            # Set output (.sac, .mseed) file names of the events associated with
-            # this cycle using the adjusted and corrected event dates
-            cycle_log.set_processed_file_names()
-
-            # Interpolate station locations at various points in the dive
-            cycle_log.compute_station_locations(mixed_layer_depth_m, preliminary_location_ok)
-
-            # Format station-location metadata for ObsPy and attach to complete dive object
-            cycle_log.set_events_obspy_trace_stats()
-
-            # Write profiles html
+def server_manifest(files, previous=None):
+    '''Return the manifest of a float's server files: the name, size, mtime,
+    and content hash of each (the hash is reused from `previous` manifest if
+    size and mtime are unchanged)
+
+    '''
+    previous = previous or {}
+    manifest = {}
+    for f in files:
+        stat = os.stat(f)
+        entry = previous.get(os.path.basename(f))
+        if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            entry = {"size": stat.st_size,
+                     "mtime": stat.st_mtime,
+                     "sha256": preprocess.file_sha256(f)}
+        manifest[os.path.basename(f)] = entry
+
+    return manifest
+
+def server_manifest_unchanged(files, previous):
+    '''Return True if `files` are exactly those recorded in `previous` manifest,
+    with the same size and either the same mtime or the same content hash
+
+    '''
+    if sorted(os.path.basename(f) for f in files) != sorted(previous):
+        return False
+
+    for f in files:
+        stat = os.stat(f)
+        entry = previous[os.path.basename(f)]
+        if entry["size"] != stat.st_size:
+            return False
+        if entry["mtime"] != stat.st_mtime and entry["sha256"] != preprocess.file_sha256(f):
+            return False
+
+    return True
+
+def process_float(mfloat, workers=None):
+    '''Process the server files of a MERMAID float into its processed directory
+
+    Args:
+        mfloat (str): Float name, e.g., "452.020-P-08"
+        workers (int): Number of processes decrypting its .BIN files
+                       (def: `decrypt_workers`)
+
+    Returns:
+        bytes: Pickle of its last cycle (for `lastcycle`), or None if none
+
+    '''
+    if workers is None:
+        workers = decrypt_workers
+
+    print("Processing {:s} .LOG & .MER files...".format(mfloat))
+
+    # Set the path for the float
+    mfloat_path = os.path.join(processed_path, mfloat, "")
+
+    # Get float number
+    mfloat_nb = re.findall("(\d+)$", mfloat)[0]
+
+    # Delete the directory if the redo flag is true
+    if redo and os.path.exists(mfloat_path):
+        shutil.rmtree(mfloat_path)
+
+    # Create directory for the float
+    if not os.path.exists(mfloat_path):
+        os.mkdir(mfloat_path)
+
+    # Copy appropriate files in the directory and remove files outside of the time range
+    files_to_copy = []
+
+    # All files begin with buoy_nb followed by underscore
+    # Add underscore avoids errors between similar buoy numbers (Ex: 01_* and 0101_*)
+    files_to_copy += glob.glob(os.path.join(server_path, mfloat_nb +  "_*"))
+
+    # Add .cmd, .out, and .vit files
+    files_to_copy += glob.glob(os.path.join(server_path, mfloat + "*"))
+
+    # Skip the float if its server files (and this version, its time range,
+    # and the decrypt databases of its .BIN files) are those of the last time
+    # it was processed to completion, which wrote (at least) the outputs
+    # requested now, and it is neither to be redone nor profiled; the manifest
+    # is deleted now and rewritten only once the float is processed
+    manifest_path = os.path.join(mfloat_path, ".server_manifest.json")
+    lastcycle_path = os.path.join(mfloat_path, ".lastcycle.pickle")
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        os.remove(manifest_path)
+    # (a range ending at present, see `utils.deploy2present`, is recorded
+    # as such, not as the time of this run)
+    float_range = [str(d) if d < creation_date else "present"
+                   for d in filterDate.get(mfloat, [])]
+    # (a float without .BIN files does not depend on the databases)
+    float_databases = {}
+    if any(f.endswith(".BIN") for f in files_to_copy):
+        float_databases = preprocess.databases_sha256()
+    if skip_unchanged_floats and manifest is not None and not redo and not timings.profiled(mfloat) \
+       and manifest["version"] == version and manifest["range"] == float_range \
+       and manifest.get("databases") == float_databases \
+       and outputs <= set(manifest.get("outputs", [])) \
+       and server_manifest_unchanged(files_to_copy, manifest["files"]):
+        print(" ...unchanged since last processed, skipping")
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        timings.lap("skip")
+        if os.path.exists(lastcycle_path):
+            with open(lastcycle_path, "rb") as f:
+                return f.read()
+        return None
+
+    # Remove existing files in the processed directory (the script may have been previously
+    # executed, copied the files, then failed)
+    for f in glob.glob(mfloat_path + "*.*"):
+        os.remove(f)
+    # (and the hidden journals and temporary files of interrupted concatenations)
+    preprocess.concatenate_clean(mfloat_path)
+
+    # Record the server files as they are staged (not as they are once the
+    # float is processed, when they may have been appended to or replaced)
+    if skip_unchanged_floats:
+        files_manifest = server_manifest(files_to_copy, manifest and manifest["files"])
+
+    # Stage files (linked rather than copied where possible)
+    staging.stage_files(files_to_copy, mfloat_path, stage_method)
+    timings.lap("stage", count=len(files_to_copy))
+
+    # Do not record server files that moved while being staged (the float is
+    # then processed again next time)
+    if skip_unchanged_floats and not server_manifest_unchanged(files_to_copy, files_manifest):
+        print(" ...server files changed while staged, will be processed again")
+        files_manifest = None
+
+    # Concatenate all files for this float
+    preprocess.concatenate_files(mfloat_path);
+    timings.lap("concatenate")
+
+    # Decrypt all files for this float
+    decrypted_path = os.path.join(mfloat_path, ".decrypted") if reuse_decrypted_bins else None
+    files_decrypted = preprocess.decrypt_all(mfloat_path, workers, decrypted_path);
+    timings.lap("decrypt", count=len(files_decrypted))
+
+    # Determine the time range of analysis (generally; birth to death of a MERMAID)
+    if mfloat in filterDate.keys():
+        begin = filterDate[mfloat][0]
+        end = filterDate[mfloat][1]
+    else:
+        begin = datetime.datetime(1000, 1, 1)
+        end = datetime.datetime(3000, 1, 1)
+
+    # Convert in cycle files
+    cycles_path = os.path.join(mfloat_path, ".cycles") if resume_cycle_conversion else None
+    preprocess.convert_in_cycle(mfloat_path,begin,end,cycles_path);
+    timings.lap("convert_in_cycle")
+
+    # Really: collect all the .MER files (next we correlate their environments to .LOG files)
+    print(" ...compiling a list of events from {:s} .MER files (GPS & seismic data)..." \
+          .format(mfloat))
+    mevents = events.Events(mfloat_path, lazy=lazy_event_data)
+    timings.lap("events", count=len(mevents.events))
+    # Build list of all S41 profiles recorded
+    ms41s = sbe41.Profiles(mfloat_path)
+    # Build list of all S61 profiles recorded
+    ms61s = sbe61.Profiles(mfloat_path)
+
+    # Concatenate RBR files
+    preprocess.concatenate_rbr_files(mfloat_path);
+    # Build list of all RBR profiles recorded
+    mRBRs = rbr.Profiles(mfloat_path)
+    timings.lap("profiles", count=len(ms41s.profiles) + len(ms61s.profiles) + len(mRBRs.profiles))
+
+    # Collect all the .CYCLE files
+    print(" ...matching those events to {:s} .LOG ('dive') files (GPS & dive metadata)..." \
+          .format(mfloat))
+    cycle_logs = cycles.get_cycles(mfloat_path, mevents, ms41s, ms61s, mRBRs)
+    timings.lap("cycles", count=len(cycle_logs))
+
+    # Verify dive logs are sorted as expected
+    if cycle_logs!= sorted(cycle_logs, key=lambda x: x.start_date):
+        raise ValueError('`cycle_logs` improperly sorted')
+
+    for i, cycle_log in enumerate(cycle_logs):
+        # Invert the data of all this cycle's events at once (batches of
+        # same-flavored, same-length wavelet coefficients)
+        icdf24_cpu_s = mevents.set_processed_data(cycle_log.events)
+        timings.lap("icdf24", count=len(cycle_log.events), child_cpu_s=icdf24_cpu_s)
+
+        # Create the directory
+        if not os.path.exists(cycle_log.processed_path):
+            os.mkdir(cycle_log.processed_path)
+
+        # Reformat and write .LOG in individual dive directory
+        cycle_log.write_datetime_cycle()
+
+        # Write .MER environment in individual directories
+        cycle_log.write_mermaid_environment_files()
+
+        # Write .S41 environment in individual directories
+        cycle_log.write_s41_environment_file();
+
+        # Write .S61 environment in individual directories
+        cycle_log.write_s61_environment_file();
+        timings.lap("write_cycles")
+
+        # Generate dive plot (and/or its depths on CSV)
+        if write_cycle_html or write_cycle_csv:
+            cycle_log.write_cycle_html(write_cycle_csv,optimize=optimized_html,include_plotly=local_html,
+                                       html=write_cycle_html)
+        # <-- timestamps not corrected for clockdrift
+        timings.lap("plot_cycles", count=1)
+
+        # The GPS list is None outside of requested begin/end dates, within
+        # which it defaults to an empty list if it is truly empty
+        if cycle_log.gps_list is None:
+            if lazy_event_data:
+                cycle_log.release_events_data()
+            continue
+
+        # Validate that the GPS may be used to correct various MERMAID
+        # timestamps, including diving/surfacing and event starttimes
+        cycle_log.validate_gps(min_gps_fix, max_gps_time)
+
+        # Apply clock corrections to the events associated with this
+        # completed dive
+        cycle_log.correct_clockdrifts()
+
+        # Set output (.sac, .mseed) file names of the events associated with
+        # this cycle using the adjusted and corrected event dates
+        cycle_log.set_processed_file_names()
+
+        # Interpolate station locations at various points in the dive
+        cycle_log.compute_station_locations(mixed_layer_depth_m, preliminary_location_ok)
+
+        # Format station-location metadata for ObsPy and attach to complete dive object
+        cycle_log.set_events_obspy_trace_stats()
+        timings.lap("correct")
+
+        # Write profiles html
+        if write_profile_html:
             cycle_log.write_profile_html(optimize=optimized_html,include_plotly=local_html)
 
-            # Write profiles data on CSV
-            if csv_file :
-                cycle_log.write_profile_csv();
+        # Write profiles data on CSV
+        if write_profile_csv:
+            cycle_log.write_profile_csv();
+        timings.lap("plot_profiles")
+
+        # Write requested output files
+        if write_png:
+            cycle_log.write_events_png()
 
-            # Write requested output files
-            if write_png:
-                cycle_log.write_events_png()
+        if write_html:
+            cycle_log.write_events_html(optimize=optimized_html,include_plotly=local_html)
+        timings.lap("plot_events")
 
-            if write_html:
-                cycle_log.write_events_html(optimize=optimized_html,include_plotly=local_html)
+        if write_sac:
+            cycle_log.write_events_sac()
+            timings.lap("sac", count=len(cycle_log.events))
 
-            if write_sac:
-                cycle_log.write_events_sac()
+        if write_mseed:
+            cycle_log.write_events_mseed()
+            timings.lap("mseed", count=len(cycle_log.events))
 
-            if write_mseed:
-                cycle_log.write_events_mseed()
+        if write_mhpsd:
+            cycle_log.write_events_mhpsd(creation_datestr)
+            timings.lap("mhpsd", count=len(cycle_log.events))
 
-            if write_mhpsd:
-                cycle_log.write_events_mhpsd(creation_datestr)
+        # Free the binary and processed data of this cycle's events (they
+        # are read and processed again, if ever needed)
+        if lazy_event_data:
+            cycle_log.release_events_data()
 
-        # Verify events sublists are sorted as expected
-        events_list = [event for cycle in cycle_logs for event in cycle.events]
-        # Sort event lists by corrected starttime is exist => use uncorrected_starttime elsewhere
-        if events_list != sorted(events_list, key=functools.cmp_to_key(sort_events)):
-            raise ValueError('`cycle_logs[*].events` improperly sorted')
+    # Verify events sublists are sorted as expected
+    events_list = [event for cycle in cycle_logs for event in cycle.events]
+    # Sort event lists by corrected starttime is exist => use uncorrected_starttime elsewhere
+    if events_list != sorted(events_list, key=functools.cmp_to_key(sort_events)):
+        raise ValueError('`cycle_logs[*].events` improperly sorted')
 
-        # Generate kml file for Google Earth
+    # Generate kml file for Google Earth
+    if write_kml:
         kml.generate(mfloat_path, mfloat, cycle_logs)
+    timings.lap("kml")
 
-        # Plot vital data
+    # Plot vital data
+    if write_vitals:
         vitals.plot_battery_voltage(mfloat_path, mfloat + ".vit", begin, end)
         vitals.plot_internal_pressure(mfloat_path, mfloat + ".vit", begin, end)
         vitals.plot_pressure_offset(mfloat_path, mfloat + ".vit", begin, end)
         if len(cycle_logs) > 1:
             vitals.plot_corrected_pressure_offset(mfloat_path, cycle_logs, begin, end)
-
-        # NB, at this point, the total event lists associated with `dive_logs`
-        # and `cycle_logs` may differ because the former collects all events
-        # and the latter winnows that list to only include unique events (via
-        # `dives.set_processed_file_names`, which removes redundant events from
-        # individual `cycle_logs.events` lists); ergo, one may use the
-        # existence of `event.station_loc` to determine what events in
-        # `dive_logs` were actually retained in `cycle_logs` (see e.g.,
-        # `events.write_traces_txt`)
-
+    timings.lap("plot_vitals")
+
+    # NB, at this point, the total event lists associated with `dive_logs`
+    # and `cycle_logs` may differ because the former collects all events
+    # and the latter winnows that list to only include unique events (via
+    # `dives.set_processed_file_names`, which removes redundant events from
+    # individual `cycle_logs.events` lists); ergo, one may use the
+    # existence of `event.station_loc` to determine what events in
+    # `dive_logs` were actually retained in `cycle_logs` (see e.g.,
+    # `events.write_traces_txt`)
+
+    # Write text and csv metadata files
+    if write_txt:
         # Write csv and txt files containing all GPS fixes from .LOG and .MER
         gps.write_gps(cycle_logs, creation_datestr, processed_path, mfloat_path)
 
@@ -361,37 +629,199 @@ def main():
 
         # Write mseed2sac and automaid metadata csv and text files
         events.write_obspy_trace_stats(cycle_logs, creation_datestr, processed_path, mfloat_path)
+    timings.lap("write_txt")
 
-        # Write GeoCSV files
+    # Write GeoCSV files
+    if write_geocsv:
         geocsv_meta = geocsv.GeoCSV(cycle_logs, creation_datestr, mixed_layer_depth_m)
         geocsv_meta.write(os.path.join(processed_path, mfloat_path, 'geo.csv'))
 
-        # Clean directories
-        files_to_delete = list()
-        files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.MER")
-        files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.S41")
-        files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.S61")
-        files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.RBR")
-        files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.LOG")
-        files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.BIN")
-        files_to_delete += glob.glob(mfloat_path + "/" + "*.CYCLE")
-        for f in files_to_delete:
-            os.remove(f)
-        # Save the last complete dive of this float to later write output list
-        # of external pressure measurements for the entire array
-        if cycle_logs:
-            lastcycle[mfloat] = cycle_logs[-1]
-
-        # Remove lingering incomplete "IcCycle" folders, if completed
-        mfloat_files = os.listdir(mfloat_path)
-        incomplete_cycles = list(filter(lambda x: 'IcCycle' in x, mfloat_files))
-        for incomplete_cycle in incomplete_cycles:
-            complete_cycle = incomplete_cycle.replace('IcCycle', '')
-            if os.path.exists(os.path.join(mfloat_path, complete_cycle)):
-                shutil.rmtree(os.path.join(mfloat_path, incomplete_cycle))
-
-        with open(mfloat_path + "/" + mfloat + '.pickle', 'wb') as handle:
-            pickle.dump(cycle_logs, handle)
+        # GeoCSV deduplication reads event binary, release it again
+        if lazy_event_data:
+            for cycle_log in cycle_logs:
+                cycle_log.release_events_data()
+    timings.lap("geocsv")
+
+    # Pickle while the .MER files (from which lazy events read their binary)
+    # still exist
+    with open(mfloat_path + "/" + mfloat + '.pickle', 'wb') as handle:
+        pickle.dump(cycle_logs, handle)
+
+    # Save the last complete dive of this float to later write output list
+    # of external pressure measurements for the entire array (also for the
+    # runs that skip this float)
+    lastcycle_pickle = None
+    if cycle_logs:
+        lastcycle_pickle = pickle.dumps(cycle_logs[-1])
+        with open(lastcycle_path, 'wb') as handle:
+            handle.write(lastcycle_pickle)
+    elif os.path.exists(lastcycle_path):
+        os.remove(lastcycle_path)
+
+    timings.lap("pickle")
+
+    # Release the memory maps (and parsed environments) of the .MER files,
+    # about to be deleted
+    events.close_mer_mmaps()
+    events.clear_mer_environments()
+
+    # Clean directories
+    files_to_delete = list()
+    files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.MER")
+    files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.S41")
+    files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.S61")
+    files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.RBR")
+    files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.LOG")
+    files_to_delete += glob.glob(mfloat_path + "/" + mfloat_nb + "_*.BIN")
+    files_to_delete += glob.glob(mfloat_path + "/" + "*.CYCLE")
+    for f in files_to_delete:
+        os.remove(f)
+    # Remove lingering incomplete "IcCycle" folders, if completed
+    mfloat_files = os.listdir(mfloat_path)
+    incomplete_cycles = list(filter(lambda x: 'IcCycle' in x, mfloat_files))
+    for incomplete_cycle in incomplete_cycles:
+        complete_cycle = incomplete_cycle.replace('IcCycle', '')
+        if os.path.exists(os.path.join(mfloat_path, complete_cycle)):
+            shutil.rmtree(os.path.join(mfloat_path, incomplete_cycle))
+
+    # This float was processed to completion: record its server files
+    if skip_unchanged_floats and files_manifest is not None:
+        manifest = {"version": version,
+                    "range": float_range,
+                    "redo": redo,
+                    "databases": float_databases,
+                    "outputs": sorted(outputs),
+                    "files": files_manifest}
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+    timings.lap("clean")
+
+    return lastcycle_pickle
+
+def set_timings():
+    '''Set up `timings` (stage timings and profiles) as requested
+
+    '''
+    timings.enabled = record_timings
+    timings.profile_stages = profile_stages
+    timings.profile_floats = profile_floats
+    timings.profile_top = profile_top
+    timings.profile_path = os.path.join(processed_path, "profiles")
+
+def init_job(icdf24_cache, mer_cache, database_path):
+    '''Initialize a worker process of `--jobs` with the state set up by `main`
+    (which processes do not inherit, unless forked)
+
+    '''
+    events.icdf24_cache = icdf24_cache
+    events.mer_cache = mer_cache
+    set_timings()
+    preprocess.pickle_databases = pickle_decrypt_databases
+    preprocess.database_path = database_path
+
+def process_float_job(mfloat):
+    '''Worker of `--jobs`: process a float (decrypting and inverting wavelet
+    transforms serially, the floats themselves being processed in parallel)
+    with its printout captured, to be printed as one block by the parent
+
+    Returns:
+        tuple: (printout, pickle of its last cycle or None, exception raised or
+                None, its `timings` records)
+
+    '''
+    events.icdf24_workers = 1
+    output = io.StringIO()
+    lastcycle_pickle = None
+    error = None
+    timings.start(mfloat)
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            lastcycle_pickle = process_float(mfloat, workers=1)
+        except Exception as e:
+            traceback.print_exc()
+            error = e
+
+    return output.getvalue(), lastcycle_pickle, error, timings.stop()
+
+def main():
+    # Set working directory in "scripts"
+    os.chdir(scripts_path)
+
+    # Create processed directory if it doesn't exist
+    if not os.path.exists(processed_path):
+        os.mkdir(processed_path)
+
+    # Search MERMAID floats
+    vitfile_path = os.path.join(server_path, "[0-9]*.*-*-*[0-9].vit")
+    mfloats = [p.split("/")[-1][:-4] for p in glob.glob(vitfile_path)]
+
+    # Create database directory if it doesn't exist
+    if not os.path.exists(database_path):
+        os.mkdir(database_path)
+
+    # Update Database
+    preprocess.pickle_databases = pickle_decrypt_databases
+    preprocess.database_update(database_path, offline, database_ttl)
+
+    # Open the cache of inverted wavelet transforms
+    if cache_icdf24:
+        events.icdf24_cache = cache.Cache(os.path.join(cache_path, "icdf24"), cache_max_bytes)
+
+    # Open the cache of parsed .MER files
+    if cache_mer_index:
+        events.mer_cache = cache.Cache(os.path.join(cache_path, "mer"), cache_max_bytes)
+
+    # Time (and, if requested, profile) the stages of each float
+    set_timings()
+
+    # Sort *.vit path
+    mfloats_sorted = sorted(mfloats, key=functools.cmp_to_key(sort_mfloats))
+
+    # Keep only the Princeton floats, if requested
+    if princeton_only:
+        mfloats_sorted = [mfloat for mfloat in mfloats_sorted
+                          if mfloat in utils.princeton_mermaids()]
+
+    # For each MERMAID float (concurrently, with `--jobs`); the printout of each
+    # float processed in parallel is printed as one block, in float order
+    workers = jobs or os.cpu_count() or 1
+    workers = min(workers, len(mfloats_sorted))
+    if workers <= 1:
+        # One pool of MERMAID_ICDF24_WORKERS processes inverts the wavelet
+        # transforms of every cycle of every float
+        icdf24_workers = events.icdf24_workers or os.cpu_count() or 1
+        if icdf24_workers > 1:
+            events.icdf24_executor = concurrent.futures.ProcessPoolExecutor(max_workers=icdf24_workers)
+
+        try:
+            for mfloat in mfloats_sorted:
+                timings.start(mfloat)
+                lastcycle_pickle = process_float(mfloat)
+                timings.stop()
+                if lastcycle_pickle is not None:
+                    lastcycle[mfloat] = pickle.loads(lastcycle_pickle)
+
+        finally:
+            if events.icdf24_executor is not None:
+                events.icdf24_executor.shutdown()
+                events.icdf24_executor = None
+
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                    initializer=init_job,
+                                                    initargs=(events.icdf24_cache,
+                                                              events.mer_cache,
+                                                              preprocess.database_path)) as executor:
+            results = executor.map(process_float_job, mfloats_sorted)
+            for mfloat, (output, lastcycle_pickle, error, records) in zip(mfloats_sorted, results):
+                print(output, end="")
+                if records is not None:
+                    timings.floats[mfloat] = records
+                if error is not None:
+                    raise error
+
+                if lastcycle_pickle is not None:
+                    lastcycle[mfloat] = pickle.loads(lastcycle_pickle)
 
     # Done looping through all dives for each float
     #______________________________________________________________________________________#
@@ -399,7 +829,15 @@ def main():
     # Print a text file of corrected external pressures measured on the final
     # dive, and warn if any are approaching the limit of 300 mbar (at which
     # point adjustment is required)
-    vitals.write_corrected_pressure_offset(lastcycle, processed_path)
+    if write_vitals:
+        vitals.write_corrected_pressure_offset(lastcycle, processed_path)
+
+    # Write the time and memory spent by each stage of each float
+    if record_timings:
+        timings_file = timings.write(processed_path, version, creation_datestr, jobs=jobs)
+        print("Wrote: {:s}".format(timings_file))
+        if print_timings:
+            print("\n" + timings.summary())
 
 if __name__ == "__main__":
     main()
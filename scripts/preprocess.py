@@ -22,14 +22,53 @@ import struct
 import re
 import traceback
 import functools
+import bisect
+import io
+import sys
+import contextlib
+import concurrent.futures
+import pickle
+import hashlib
+import tempfile
+import time
 import utils
+import setup
+import staging
 from obspy import UTCDateTime
 
 mermaid_path = os.environ["MERMAID"]
 database_path = os.path.join(mermaid_path, "database")
 
+# Get current version number.
+version = setup.get_version()
+
+# Persist compiled decrypt databases (see `decrypt_load_database`) across runs
+pickle_databases = False
+
+# Server of the decrypt databases (overridden, e.g., by a local test server
+# with the environmental variable MERMAID_DATABASE_URL)
+database_url = os.environ.get("MERMAID_DATABASE_URL", "http://mermaid.osean.fr/databases/")
+database_auth = ('osean', 'osean3324')
+database_timeout = 10
+
+# Seconds after a successful database update during which the server is not
+# queried again
+database_ttl = 24 * 3600
+
+# Databases.json and compiled decrypt databases, loaded once per run
+databases_link = None
+decrypt_databases = {}
+database_hashes = {}
+
+# Name of the manifest of decrypted BIN files (see decrypt_all)
+DECRYPT_MANIFEST_NAME = "manifest.json"
+# Name of the checkpoint of convert_in_cycle in its store path
+CYCLE_CHECKPOINT_NAME = "checkpoint.json"
+
 
 DATABASE_LINK_NAME = "Databases.json"
+# Name of the state of database_update (ETags and time of last update)
+DATABASE_STATE_NAME = ".state.json"
 
 PREPROCESS_INFOS = ":[PREPROCESS]"
 REGEX_INFOS = r":\[PREPROCESS\]"
@@ -38,68 +77,224 @@ PREPROCESS_END = ":[PREPROCESS]End of cycle"
 REGEX_FILE_END = r":\[PREPROCESS\]End of cycle"
 
 
-def database_update(path):
+def database_fetch(name, etag=None):
+    '''
+    GET a file of the database server, conditionally on its ETag if given
+
+    Returns (status_code, ETag, JSON content (None unless status is 200))
+    (raises on connection errors)
+    '''
+    headers = {"If-None-Match": etag} if etag else {}
+    request = requests.get(database_url + name, auth=database_auth,
+                           headers=headers, timeout=database_timeout)
+    data = None
+    if request.status_code == 200:
+        data = request.json()
+    return request.status_code, request.headers.get("ETag"), data
+
+
+def database_write(file_path, data, **kwargs):
+    '''
+    Write JSON content to a database file (atomically), unless the file
+    already holds that exact content; return True if it was written
+    '''
+    content = json.dumps(data, **kwargs)
+    if os.path.exists(file_path):
+        with open(file_path, "r") as f:
+            if f.read() == content:
+                return False
+    fd, tmp_path = tempfile.mkstemp(prefix=".", dir=os.path.dirname(file_path))
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+    return True
+
+
+def database_update(path, offline=False, ttl=None, workers=8):
     '''
 
     Update databases files into 'database_path' (need connection)
     (Does not stop script execution if connection is not established)
 
+    The ETag of each file received is kept in the state file (.state.json) of
+    the database path, and sent back on the next update so that the server
+    only returns files that changed (304: Not Modified otherwise).  Databases
+    are then downloaded concurrently, and only files whose content changed are
+    rewritten (atomically).  All files are left untouched if any download
+    fails.
+
     Keyword arguments:
     path -- Path to store databases, can be null (defaut : os.environ["MERMAID"]/database)
+    offline -- Use the databases already in path, without connecting to the server
+    ttl -- Seconds after a successful update during which the server is not
+           queried again (default : database_ttl; 0 : always query)
+    workers -- Number of concurrent downloads
 
     '''
     print("Update Databases")
-    network = 1
-    database_list = []
+    global databases_link
+    databases_link = None
+    decrypt_databases.clear()
+    database_hashes.clear()
     if path :
         global database_path
         database_path = path
+    if ttl is None :
+        ttl = database_ttl
+    link_path = os.path.join(database_path, DATABASE_LINK_NAME)
+    state_path = os.path.join(database_path, DATABASE_STATE_NAME)
+
+    if offline :
+        print("Offline: use databases in " + database_path)
+        return
+
+    # Read the state of the last update (ETags, time of last success)
+    state = {"checked": 0, "etags": {}}
+    if os.path.exists(state_path) and os.path.exists(link_path):
+        with open(state_path, "r") as f:
+            state = json.load(f)
+    if ttl and time.time() - state["checked"] < ttl :
+        print("Databases updated less than " + str(ttl) + " s ago")
+        return
+    etags = state["etags"]
+
     try:
         # Get linker file (link database and profiler version)
-        url = 'http://mermaid.osean.fr/databases/' + DATABASE_LINK_NAME
-        request = requests.get(url, auth=('osean', 'osean3324'), timeout=10)
+        status_code, link_etag, database_list = database_fetch(DATABASE_LINK_NAME, etags.get(DATABASE_LINK_NAME))
     except Exception as e:
         print("Exception: \"" + str(e) + "\" detected when get " + DATABASE_LINK_NAME)
-        network = 0
-    else:
-        if request.status_code == 200:
-            # Read link file content into object
-            database_list = request.json()
-            # Retreive list of databases into linker file
-            for database in database_list:
-                if database["Name"]:
-                    try:
-                        # Get Database files (one by one)
-                        url_database = 'http://mermaid.osean.fr/databases/' + database["Name"]
-                        new_req = requests.get(url_database, auth=('osean', 'osean3324'), timeout=10)
-                        # Store temporary database into linker object
-                        database["data"] = new_req.json()
-                        if new_req.status_code != 200:
-                            print("Error " + str(new_req.status_code) + " when get " + database["Name"])
-                            network = 0
-                    except Exception as e:
-                        print("Exception: \"" + str(e) + "\" detected when get " + str(database["Name"]))
-                        network = 0
-        else:
-            print("Error " + str(request.status_code) + " when get " + DATABASE_LINK_NAME)
-            network = 0
-        if network > 0:
-            # All databases received correctly => delete current files
-            if os.path.exists(database_path):
-                shutil.rmtree(database_path)
-            os.makedirs(database_path)
-            # Store databases content
-            for database in database_list:
-                if database["Name"]:
-                    path = os.path.join(database_path, database["Name"])
-                    with open(path, 'w') as databasefile:
-                        json.dump(database["data"], databasefile)
-                    # Delete content from link object
-                    database.pop('data', None)
-            # Store link file
-            link_path = os.path.join(database_path, DATABASE_LINK_NAME)
-            with open(link_path, 'w') as linkfile:
-                json.dump(database_list, linkfile, indent=4)
+        return
+    if status_code == 304:
+        # Not modified: read link file stored by the last update
+        with open(link_path, "r") as f:
+            database_list = json.load(f)
+    elif status_code != 200:
+        print("Error " + str(status_code) + " when get " + DATABASE_LINK_NAME)
+        return
+
+    # Get Database files (concurrently), sending the ETag of those we have
+    names = [database["Name"] for database in database_list if database["Name"]]
+    def fetch(name):
+        etag = None
+        if os.path.exists(os.path.join(database_path, name)):
+            etag = etags.get(name)
+        return database_fetch(name, etag)
+    network = 1
+    results = {}
+    if names:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(names)))) as executor:
+            futures = [executor.submit(fetch, name) for name in names]
+            for name, future in zip(names, futures):
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print("Exception: \"" + str(e) + "\" detected when get " + str(name))
+                    network = 0
+                    continue
+                if results[name][0] not in (200, 304):
+                    print("Error " + str(results[name][0]) + " when get " + name)
+                    network = 0
+    if network == 0:
+        return
+
+    # All databases received correctly => store those that changed
+    os.makedirs(database_path, exist_ok=True)
+    new_etags = {DATABASE_LINK_NAME: link_etag}
+    for name in names:
+        status_code, etag, data = results[name]
+        new_etags[name] = etag
+        if status_code == 200 and database_write(os.path.join(database_path, name), data):
+            print("Updated " + name)
+    # Delete databases no longer listed (and their compiled pickles)
+    for file_path in glob.glob(os.path.join(database_path, "*")):
+        file_name = os.path.basename(file_path)
+        if file_name.endswith(".pickle"):
+            file_name = file_name[:-len(".pickle")]
+        if file_name != DATABASE_LINK_NAME and file_name not in names:
+            os.remove(file_path)
+    # Store link file, and the state of this update
+    database_write(link_path, database_list, indent=4)
+    database_write(state_path, {"checked": time.time(), "etags": new_etags}, indent=4)
+
+
+def concatenate_journal_path(target_path):
+    '''
+    Return the path of the journal of concatenate_fragments into target_path
+    '''
+    dir_name, target_name = os.path.split(target_path)
+    return os.path.join(dir_name, "." + target_name + ".concat")
+
+
+def concatenate_clean(path):
+    '''
+    Delete the journals (".<target>.concat") and temporary files
+    (".<target>.concat-*") left in path by interrupted concatenate_fragments,
+    e.g., before its files are staged anew (the journals refer to the
+    fragments of the last staging)
+    '''
+    for file_path in glob.glob(os.path.join(path, ".*.concat")) \
+                     + glob.glob(os.path.join(path, ".*.concat-*")):
+        os.remove(file_path)
+
+
+def concatenate_fragments(file_paths,target_path):
+    '''
+    Concatenate files, in order, into target_path (which may be one of them),
+    then delete the others
+
+    The files are streamed into a temporary file renamed over target_path, so
+    that it is never partially written.  A journal (".<target>.concat")
+    recording the fragments and the hash of the result is written before the
+    rename and deleted once the fragments are, so that a call interrupted at
+    any point and repeated neither loses nor duplicates any fragment.  A
+    process killed outright may also leave the temporary file
+    (".<target>.concat-*"); both are deleted by concatenate_clean.
+
+    Keyword arguments:
+    file_paths -- paths of files to concatenate, in order
+    target_path -- path of the concatenated file
+
+    '''
+    dir_name = os.path.dirname(target_path)
+    journal_path = concatenate_journal_path(target_path)
+    if os.path.exists(journal_path):
+        with open(journal_path, "r") as f:
+            journal = json.load(f)
+        if os.path.exists(target_path) and file_sha256(target_path) == journal["sha256"]:
+            # Interrupted after the rename: only the deletions remain
+            for fragment_name in journal["fragments"]:
+                fragment_path = os.path.join(dir_name, fragment_name)
+                if os.path.exists(fragment_path):
+                    os.remove(fragment_path)
+            os.remove(journal_path)
+            return
+        # Interrupted before the rename: the files are untouched, start again
+        os.remove(journal_path)
+
+    # Stream the files into a temporary file, hashing what is written
+    h = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(journal_path) + "-", dir=dir_name or ".")
+    try:
+        with os.fdopen(fd, "wb") as ftmp:
+            for file_path in file_paths:
+                with open(file_path, "rb") as fl:
+                    for chunk in iter(lambda: fl.read(2**20), b""):
+                        h.update(chunk)
+                        ftmp.write(chunk)
+        fragments = [os.path.basename(f) for f in file_paths
+                     if os.path.abspath(f) != os.path.abspath(target_path)]
+        with open(journal_path, "w") as f:
+            json.dump({"fragments": fragments, "sha256": h.hexdigest()}, f)
+        # (Also replaces, rather than writes through, a target staged by link)
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    for fragment_name in fragments:
+        os.remove(os.path.join(dir_name, fragment_name))
+    os.remove(journal_path)
 
 
 '''
@@ -120,31 +315,15 @@ def concatenate_files(path):
     files_path += glob.glob(path + "*.BIN")
     # Concatenate all files
     for file_path in files_path:
-        bin = b''
         # list file with same head than log file
         files_to_merge = list(glob.glob(file_path[:-4] +".[0-9][0-9][0-9]"))
         # Add end file to the list
         files_to_merge.append(file_path)
         # Sort list => [0000_XXXXXX.000,0000_XXXXXX.001,0000_XXXXXX.002,0000_XXXXXX.LOG]
         files_to_merge.sort()
-        if len(files_to_merge) > 1:
-            # Need to merge multiple file
-            for file_to_merge in files_to_merge :
-                if file_to_merge[-3:].isdigit():
-                    # Extension with digit => append to string
-                    with open(file_to_merge, "rb") as fl:
-                        bin += fl.read()
-                    # Remove file after read
-                    os.remove(file_to_merge)
-                else :
-                    if len(bin) > 0:
-                        # If log extension is not a digit and the log string is not empty
-                        # we need to add it at the end of the file
-                        with open(file_to_merge, "rb") as fl:
-                            bin += fl.read()
-                        with open(file_to_merge, "wb") as fl:
-                            fl.write(bin)
-                        bin = b''
+        # Need to merge multiple file (or finish an interrupted merge)
+        if len(files_to_merge) > 1 or os.path.exists(concatenate_journal_path(file_path)):
+            concatenate_fragments(files_to_merge, file_path)
 
 '''
 
@@ -161,15 +340,10 @@ def concatenate_rbr_files(path):
         # list file with same head than log file
         files_to_merge = list(glob.glob(file_path[:-4] +".R[0-9][0-9]"))
         # Sort list => [0000_XXXXXX.R00,0000_XXXXXX.R01,0000_XXXXXX.R02,0000_XXXXXX.R03]
-        files_to_merge.sort()       
-        for file_to_merge in files_to_merge :
-            bin = b''
-            with open(file_to_merge, "rb") as fl:
-                bin = fl.read()
-            with open(file_path, "ab") as fl:
-                fl.write(bin)
-                # Remove file after append
-                os.remove(file_to_merge)
+        files_to_merge.sort()
+        # Append to the .RBR file (or finish an interrupted merge)
+        if files_to_merge or os.path.exists(concatenate_journal_path(file_path)):
+            concatenate_fragments([file_path] + files_to_merge, file_path)
 
 # Get database name with linker file and version read on file
 '''
@@ -182,10 +356,13 @@ model -- Model number of the profiler (0:classic;1:Marittimo(Moored version);2:M
 
 '''
 def decrypt_get_database(file_version,model) :
+    global databases_link
     link_path = os.path.join(database_path,DATABASE_LINK_NAME)
-    if os.path.exists(link_path):
-        with open(link_path,"r") as f:
-            databases = json.loads(f.read())
+    if databases_link is not None or os.path.exists(link_path):
+        if databases_link is None:
+            with open(link_path,"r") as f:
+                databases_link = json.loads(f.read())
+        databases = databases_link
         # get major and minor versions
         file_version=file_version.split(".")
         file_major = 2
@@ -223,252 +400,288 @@ def decrypt_get_database(file_version,model) :
 
 
 
+# Precompiled (little-endian) layouts of the binary log records
+EXPLICIT_HEADER = struct.Struct('<HIBB') # ID, timestamp, infos, data size
+ARG_HEADER = struct.Struct('<BB')        # argument infos, argument size
+SHORT_ID = struct.Struct('<B')
+TIMESTAMP = struct.Struct('<I')
+
+# Integer arguments of explicit logs, by (argument type, size)
+EXPLICIT_ARGS = {(0, 4): struct.Struct('<i'),
+                 (0, 2): struct.Struct('<h'),
+                 (0, 1): struct.Struct('<b'),
+                 (1, 4): struct.Struct('<I'),
+                 (1, 2): struct.Struct('<H'),
+                 (1, 1): struct.Struct('<B')}
+
+# Integer arguments of short logs, by (sign, size)
+SHORT_ARGS = {("signed", 4): struct.Struct('<i'),
+              ("signed", 2): struct.Struct('<h'),
+              ("signed", 1): struct.Struct('<b'),
+              ("unsigned", 4): struct.Struct('<I'),
+              ("unsigned", 2): struct.Struct('<H'),
+              ("unsigned", 1): struct.Struct('<B')}
+
+REGEX_SHORT_FORMAT = re.compile(r"[^%]*(%([\-\+ 0])?(\d)*\.?([\d\*])*([dfcsXxupt]))")
+
+class DecryptDatabase:
+    '''
+
+    Decrypt database (one of the JSON files listed in Databases.json) compiled
+    for fast decryption: log formats are looked up by ID through dictionaries
+    (memoized per ID) rather than by scanning the cards, and the printf formats
+    and struct codes of short logs are parsed once per ID rather than per log
+
+    The lookups return exactly what the backward search through a card does:
+    the entry of greatest index <= min(ID, len(card)-1) with a matching ID.
+
+    Keyword arguments:
+    database_file_path -- path of the database JSON file
+
+    '''
+    def __init__(self,database_file_path):
+        with open(database_file_path,"r") as f:
+            decrypt_list = json.loads(f.read())
+        log_card = []
+        warn_card = []
+        err_card = []
+        short_card = []
+        for decrypt_card in decrypt_list:
+            if decrypt_card["TYPE"] == "LOG":
+                log_card = decrypt_card["DECRYPTCARD"]
+            elif decrypt_card["TYPE"] == "WARN":
+                warn_card = decrypt_card["DECRYPTCARD"]
+            elif decrypt_card["TYPE"] == "ERR":
+                err_card = decrypt_card["DECRYPTCARD"]
+            elif decrypt_card["TYPE"] == "SHORT":
+                short_card = decrypt_card["DECRYPTCARD"]
+
+        # Cards of explicit logs, indexed by log type (0b11, "<DBG>", has none)
+        self.explicit_cards = [log_card, warn_card, err_card, []]
+        self.explicit_indexes = [self.index_card(card) for card in self.explicit_cards]
+        self.explicit_formats = [{}, {}, {}, {}]
+        self.short_card = short_card
+        self.short_index = self.index_card(short_card)
+        self.short_formats = {}
+
+    @staticmethod
+    def index_card(card):
+        # Map each ID to the (ascending) indexes of its entries in the card
+        index = {}
+        for i, entry in enumerate(card):
+            index.setdefault(entry["ID"], []).append(i)
+        return index
+
+    @staticmethod
+    def search_card(card, index, key, id):
+        # Greatest index <= min(id, len(card)-1) of an entry whose ID is key
+        indexes = index.get(key)
+        if not indexes:
+            return None
+        i = bisect.bisect_right(indexes, min(id, len(card)-1)) - 1
+        return card[indexes[i]] if i >= 0 else None
+
+    def get_explicit(self,logtype,id):
+        '''
+        Return the (Formats, File) of an explicit log, where each format is a
+        tuple of the format string (with literal "\\r\\n" replaced by CRLF) and
+        whether it contains "%c" and "%.*s"; or None if not in the database
+        '''
+        formats = self.explicit_formats[logtype]
+        if id not in formats:
+            entry = self.search_card(self.explicit_cards[logtype], self.explicit_indexes[logtype],
+                                     "0x"+"{0:0{1}X}".format(id,4)+"UL", id)
+            if entry is None or len(entry["FORMATS"]) <= 0:
+                formats[id] = None
+            else:
+                Formats = []
+                for Format in entry["FORMATS"]:
+                    Format = Format.replace(r"\r\n","\r\n")
+                    Formats.append((Format, "%c" in Format, "%.*s" in Format))
+                formats[id] = (Formats, entry["FILE"])
+        return formats[id]
+
+    def get_short(self,shortId):
+        '''
+        Return the list of arguments of a short log, each a tuple of its size,
+        sign, struct code (None if invalid for its sign), format string and,
+        for signed and unsigned arguments, the parsed format specifier
+        (replace pattern, specifier, divisor, float format; None if not found);
+        or None if not in the database
+        '''
+        if shortId not in self.short_formats:
+            entry = self.search_card(self.short_card, self.short_index, shortId, shortId)
+            if entry is None or len(entry["ARGS"]) == 0:
+                self.short_formats[shortId] = None
+            else:
+                args = []
+                for arg in entry["ARGS"]:
+                    size = arg["SIZE"]
+                    sign = arg["SIGN"]
+                    if sign != "signed" and sign != "unsigned":
+                        args.append((size, None, None, arg["FORMAT"], None))
+                        continue
+                    parsed = None
+                    shortformatfind = REGEX_SHORT_FORMAT.findall(arg["FORMAT"])
+                    if len(shortformatfind) > 0:
+                        replace_pattern = shortformatfind[0][0]
+                        precision = shortformatfind[0][3]
+                        specifier = shortformatfind[0][4]
+                        # value is a float stored on integer
+                        divisor = 1
+                        if precision.isnumeric():
+                            divisor = 10 ** int(precision)
+                        argf_format = "{:." + precision + "f}"
+                        parsed = (replace_pattern, specifier, divisor, argf_format)
+                    args.append((size, sign, SHORT_ARGS.get((sign, size)), arg["FORMAT"], parsed))
+                self.short_formats[shortId] = args
+        return self.short_formats[shortId]
+
+
+def decrypt_load_database(database_file_path):
+    '''
+    Return the DecryptDatabase compiled from a database file, built once per
+    run (cleared by database_update) and, if pickle_databases, persisted as
+    "<database>.pickle" in the database directory (rebuilt whenever the
+    database file or automaid version changes)
+
+    Keyword arguments:
+    database_file_path -- path of the database JSON file
+
+    '''
+    if database_file_path in decrypt_databases:
+        return decrypt_databases[database_file_path]
+
+    stat = os.stat(database_file_path)
+    stamp = (version, stat.st_size, stat.st_mtime_ns)
+    pickle_path = database_file_path + ".pickle"
+    database = None
+    if pickle_databases and os.path.exists(pickle_path):
+        try:
+            with open(pickle_path, "rb") as f:
+                pickle_stamp, pickle_database = pickle.load(f)
+            if pickle_stamp == stamp:
+                database = pickle_database
+        except Exception:
+            database = None
+    if database is None:
+        database = DecryptDatabase(database_file_path)
+        if pickle_databases:
+            with open(pickle_path, "wb") as f:
+                pickle.dump((stamp, database), f)
+
+    decrypt_databases[database_file_path] = database
+    return database
+
+
 '''
 
 Decrypts a log line using an expilicit format
 The number and size of arguments is explicitly described in the binary file.
 
 Keyword arguments:
-f -- file reader
-LOG_card -- Object for LOG decryption (database)
-WARN_card -- Object for WARNING decryption (database)
-ERR_card -- Object for ERROR decryption (database)
+data -- memoryview of the binary file
+pos -- offset of the log line (just after its "#*" header) in data
+database -- DecryptDatabase (LOG, WARNING and ERROR cards)
+
+Returns the decrypted line ("" on error) and the offset just after the bytes
+consumed in decrypting it (the end of data if it was truncated).
 
 '''
 
-def decrypt_explicit(f,LOG_card,WARN_card,ERR_card) :
+def decrypt_explicit(data,pos,database) :
     #Read head
-    string = ""
-    IDbytes = f.read(2)
-    if len(IDbytes) != 2 :
-        print("err:IDbytes")
-        return "";
-    TIMESTAMPbytes = f.read(4)
-    if len(TIMESTAMPbytes) != 4 :
-        print("err:TIMESTAMPbytes")
-        return "";
-    INFOSbytes = f.read(1)
-    if INFOSbytes == "" :
-        print("err:INFOSbytes")
-        return "";
-    DATASIZEbytes = f.read(1)
-    if DATASIZEbytes == "" :
-        print("err:DATASIZEbytes")
-        return "";
-    #unpack head
-    try :
-        id = struct.unpack('<H', IDbytes)[0]
-        timestamp = struct.unpack('<I', TIMESTAMPbytes)[0]
-        infos = struct.unpack('<B', INFOSbytes)[0]
-        dataSize = struct.unpack('<B', DATASIZEbytes)[0]
-    except :
-        traceback.print_exc()
-        print("err:header")
-        return "";
+    end = len(data)
+    if end - pos < EXPLICIT_HEADER.size :
+        if end - pos < 2 :
+            print("err:IDbytes")
+        elif end - pos < 6 :
+            print("err:TIMESTAMPbytes")
+        else :
+            print("err:header")
+        return "", end
+    id, timestamp, infos, dataSize = EXPLICIT_HEADER.unpack_from(data, pos)
+    pos += EXPLICIT_HEADER.size
 
     #Process head
-    idString = "0x"+"{0:0{1}X}".format(id,4)+"UL"
-    binaryinfo = "{0:08b}".format(infos)
-    logtype = "00"
-    argformat = "00"
-    logtype = binaryinfo[-2:]
-    argformat = binaryinfo[-4:-2]
-    if argformat != "00":
-        return "";
-
-    #print ("ID : " + str(id))
-    #print ("IDString : " + str(idString))
-    #print ("Timestamp : " + str(timestamp))
-    #print ("Infos : " + str(infos))
-    #print ("BinaryInfos : " + str(binaryinfo))
-    #print ("Type : " + str(type))
-    #print ("ArgFormat : " + str(argformat))
-    #print ("dataSize : " + str(dataSize))
-
-    decrypt_card={}
-    type_string = ""
-    if logtype == "00":
-        decrypt_card = LOG_card
-    elif logtype == "01":
-        type_string = "<WARN>"
-        decrypt_card = WARN_card
-    elif logtype == "10":
-        type_string = "<ERR>"
-        decrypt_card = ERR_card
-    else :
-        type_string = "<DBG>"
-
-    Formats = []
-    File = "MAIN"
-
-    if(id < len(decrypt_card)) :
-        index = id
-    else :
-        index = len(decrypt_card)-1
-    while index >= 0 :
-        if decrypt_card[index]["ID"] == idString:
-            Formats = decrypt_card[index]["FORMATS"]
-            File = decrypt_card[index]["FILE"]
-            break;
-        index = index - 1
-
-    if len(Formats) <= 0 :
-        f.read(dataSize)
-        string += str(timestamp) + ":" + type_string + "["+"{:04d}".format(id)+"] Format not found\r\n"
-        return string
-    #print (Formats)
+    logtype = infos & 0b11
+    argformat = (infos >> 2) & 0b11
+    if argformat != 0:
+        return "", pos
+
+    type_string = ("", "<WARN>", "<ERR>", "<DBG>")[logtype]
+    explicit = database.get_explicit(logtype,id)
+    if explicit is None :
+        pos = min(pos + dataSize, end)
+        return str(timestamp) + ":" + type_string + "["+"{:04d}".format(id)+"] Format not found\r\n", pos
+    Formats, File = explicit
+
+    line = []
     if File != "__BLANK__" :
-        string += str(timestamp) + ":"
-        string +="["+"{:6}".format(File)+","+"{:04d}".format(id)+"]"
-        string += type_string
+        line.append(str(timestamp) + ":")
+        line.append("["+"{:6}".format(File)+","+"{:04d}".format(id)+"]")
+        line.append(type_string)
     index=0
     argIndex=0
     if dataSize > 0:
         while index < dataSize :
             #Read Argument Head
-            ARGINFOSByte = f.read(1)
-            if ARGINFOSByte == "":
-                print("err:ARGINFOSByte")
-                return "";
-            ARGSIZEByte = f.read(1)
-            if ARGSIZEByte == "":
-                print("err:ARGSIZEByte")
-                return "";
-            #Unpack Argument Head
-            try :
-                ArgInfos=struct.unpack('<B', ARGINFOSByte)[0]
-                ArgSize = struct.unpack('<B', ARGSIZEByte)[0]
-            except :
-                traceback.print_exc()
+            if end - pos < ARG_HEADER.size :
                 print("err:INFOSSIZE")
-                return "";
+                return "", end
+            ArgInfos, ArgSize = ARG_HEADER.unpack_from(data, pos)
+            pos += ARG_HEADER.size
 
             #Process Argument Head
-            ArgInfosBinary="{0:08b}".format(ArgInfos)
-            ArgType = ArgInfosBinary[-2:]
-
-            #print ("ArgInfosBinary : " + str(ArgInfosBinary))
-            #print ("ArgType : " + str(ArgType))
-            #print ("ArgSize : " + str(ArgSize))
+            ArgType = ArgInfos & 0b11
             index = index+2
-            Formats[argIndex] = Formats[argIndex].replace(r"\r\n","\r\n")
+            Format, has_c, has_star_s = Formats[argIndex]
             if ArgSize > 0:
                 Arg = 0
-                if ArgType == "00":
-                    if ArgSize == 4:
-                        ArgByte = f.read(4)
-                        if len(ArgByte) != 4 :
-                            print("err:TYPE00SIZE04")
-                            return "";
-                        try :
-                            Arg = struct.unpack('<i', ArgByte)[0]
-                        except :
-                            traceback.print_exc()
-                            print("err:TYPE00SIZE04")
-                            return "";
-                    elif ArgSize == 2:
-                        ArgByte = f.read(2)
-                        if len(ArgByte) != 2 :
-                            print("err:TYPE00SIZE02")
-                            return "";
-                        try :
-                            Arg = struct.unpack('<h', ArgByte)[0]
-                        except :
-                            traceback.print_exc()
-                            print("err:TYPE00SIZE02")
-                            return "";
-                    elif ArgSize == 1:
-                        ArgByte = f.read(1)
-                        if ArgByte == "" :
-                            print("err:TYPE00SIZE01")
-                            return "";
-                        try :
-                            Arg = struct.unpack('<b', ArgByte)[0]
-                        except :
-                            traceback.print_exc()
-                            print("err:TYPE00SIZE01")
-                            return "";
-                elif ArgType == "01":
-                    # unsigned integer
-                    if ArgSize == 4:
-                        ArgByte = f.read(4)
-                        if len(ArgByte) != 4 :
-                            print("err:TYPE01SIZE04")
-                            return "";
-                        try :
-                            Arg = struct.unpack('<I', ArgByte)[0]
-                        except :
-                            traceback.print_exc()
-                            print("err:TYPE01SIZE04")
-                            return "";
-                    elif ArgSize == 2:
-                        ArgByte = f.read(2)
-                        if len(ArgByte) != 2 :
-                            print("err:TYPE01SIZE02")
-                            return "";
-                        try :
-                            Arg = struct.unpack('<H', ArgByte)[0]
-                        except :
-                            traceback.print_exc()
-                            print("err:TYPE01SIZE02")
-                            return "";
-                    elif ArgSize == 1:
-                        ArgByte = f.read(1)
-                        if ArgByte == "":
-                            print("err:TYPE01SIZE01")
-                            return "";
-                        try :
-                            Arg = struct.unpack('<B', ArgByte)[0]
-                        except :
-                            traceback.print_exc()
-                            print("err:TYPE01SIZE01")
-                            return "";
-                elif ArgType == "11":
+                if (ArgType, ArgSize) in EXPLICIT_ARGS:
+                    # signed (00) or unsigned (01) integer; other sizes are
+                    # not read
+                    if end - pos < ArgSize :
+                        print("err:TYPE{:02b}SIZE{:02d}".format(ArgType, ArgSize))
+                        return "", end
+                    Arg = EXPLICIT_ARGS[(ArgType, ArgSize)].unpack_from(data, pos)[0]
+                    pos += ArgSize
+                elif ArgType == 0b11:
                     # string
-                    ArgByte = f.read(ArgSize)
-                    if len(ArgByte) != ArgSize :
+                    if end - pos < ArgSize :
                         print("err:TYPE11")
-                        return "";
+                        return "", end
+                    ArgByte = data[pos:pos+ArgSize]
+                    pos += ArgSize
                     if ArgByte[ArgSize-1] == 0 :
                         ArgByte = ArgByte[:-1]
-                    Arg = ArgByte
-                    try :
-                        Arg = Arg.decode('ascii', 'ignore')
-                    except :
-                        traceback.print_exc()
-                        print("err:TYPE11")
-                        return "";
-                    #replace none ascii characters
-                #print (ArgSize)
-                #print ("Format : " + str(Formats[argIndex]) + "\r\n")
+                    Arg = bytes(ArgByte).decode('ascii', 'ignore')
                 try :
-                    if "%c" in Formats[argIndex]:
+                    if has_c:
                         if Arg < 0 :
                             Arg = 0
                         elif Arg > 0x10FFFF:
                             Arg = 0x10FFFF
 
-                    if "%.*s" in Formats[argIndex]:
-                        string += (Formats[argIndex] % (ArgSize,Arg))
+                    if has_star_s:
+                        line.append(Format % (ArgSize,Arg))
                     else :
-                        string += (Formats[argIndex] % Arg)
+                        line.append(Format % Arg)
                 except :
                     traceback.print_exc()
-                    print("error format \"{}\" ARG {}".format(Formats[argIndex],Arg))
-                    return "";
+                    print("error format \"{}\" ARG {}".format(Format,Arg))
+                    return "", pos
             else :
-                #print ("Format : " + str(Formats[argIndex]) + "\r\n")
-                string += str(Formats[argIndex])
+                line.append(str(Format))
                 index = index + 1
             index = index + ArgSize
             argIndex = argIndex + 1
     else :
-        #print ("Format : " + (Formats[0].replace(r"\r\n","\r\n")) + "\r\n")
-        string += str(Formats[0].replace(r"\r\n","\r\n"))
-    string += "\r\n"
-    return string
+        line.append(str(Formats[0][0]))
+    line.append("\r\n")
+    return "".join(line), pos
 
-def decrypt_short(f,short_card) :
+def decrypt_short(data,pos,database) :
     '''
 
     Decrypts a log line using an short format
@@ -477,168 +690,247 @@ def decrypt_short(f,short_card) :
     (Pressure measurement, Pump time, valve time ...)
 
     Keyword arguments:
-    f -- file reader
-
-    '''
-    string = ""
-    id = f.read(1)
-    format = ""
-    shortId = 256
-    if id == "" :
-        print("err:EMPTYSHORTID")
-        return "";
-    try :
-        shortId = struct.unpack('<B', id)[0]
-    except :
-        traceback.print_exc()
+    data -- memoryview of the binary file
+    pos -- offset of the log line (just after its "@" header) in data
+    database -- DecryptDatabase (SHORT card)
+
+    Returns the decrypted line ("" on error) and the offset just after the
+    bytes consumed in decrypting it (the end of data if it was truncated).
+
+    '''
+    end = len(data)
+    if end - pos < SHORT_ID.size :
         print("err:UNPACKSHORTID")
-        return "";
+        return "", end
+    shortId = SHORT_ID.unpack_from(data, pos)[0]
+    pos += SHORT_ID.size
 
     # Search formats link to short log
-    args = []
-    if(shortId < len(short_card)) :
-        index = shortId
-    else :
-        index = len(short_card)-1
-    while index >= 0 :
-        if short_card[index]["ID"] == shortId:
-            args = short_card[index]["ARGS"]
-            break;
-        index = index - 1
-    if len(args) == 0 :
+    args = database.get_short(shortId)
+    if args is None :
         print("err:NoShortFormatFound")
-        return ""
+        return "", pos
 
     # Get timestamp
-    timestamp_bytes = f.read(4)
-    if len(timestamp_bytes) != 4 :
+    if end - pos < TIMESTAMP.size :
         print("err:timestamp")
-        return ""; 
-    try :
-        timestamp = struct.unpack('<I', timestamp_bytes)[0]     
-    except :
-        traceback.print_exc()    
-        print("err:unpacktimestamp")
-        return ""
+        return "", end
+    timestamp = TIMESTAMP.unpack_from(data, pos)[0]
+    pos += TIMESTAMP.size
+
     # Init format with timestamp
-    format_str = str(timestamp) + ":"   
-    for arg in args:
-        size = arg["SIZE"]
-        value = f.read(size)
-        if len(value) != size :
+    line = [str(timestamp) + ":"]
+    for size, sign, arg_struct, arg_format, parsed in args:
+        if end - pos < size :
             print("err:valueSize")
-            return ""
-        unpack_arg = ""
+            return "", end
+        value_pos = pos
+        pos += size
         # get format of value
-        if arg["SIGN"] == "signed":
-            if size == 4:
-                unpack_arg = '<i'
-            elif size == 2:
-                unpack_arg = '<h'
-            elif size == 1:
-                unpack_arg = '<b'
-            else :
-                print("err:wrongsignedformat")
-        elif arg["SIGN"] == "unsigned":
-            if size == 4:
-                unpack_arg = '<I'
-            elif size == 2:
-                unpack_arg = '<H'
-            elif size == 1:
-                unpack_arg = '<B'
-            else :
-                print("err:wrongunsignedformat")
-        else :
-            format_str = format_str + arg["FORMAT"]
+        if sign is None:
+            line.append(arg_format)
             continue
-        # unpack argument value
-        try :
-            arg_value = struct.unpack(unpack_arg, value)[0]
-        except :
-            traceback.print_exc()    
+        if arg_struct is None:
+            print("err:wrong" + sign + "format")
             print("err:unpackvalue")
-            return ""   
+            return "", pos
+        # unpack argument value
+        arg_value = arg_struct.unpack_from(data, value_pos)[0]
         # seach specific format
-        regexShortFomat = r"[^%]*(%([\-\+ 0])?(\d)*\.?([\d\*])*([dfcsXxupt]))"
-        shortformatfind = re.findall(regexShortFomat, arg["FORMAT"])
-        if len(shortformatfind) == 0 :
+        if parsed is None :
             print("err:wrongformat")
-            return ""
+            return "", pos
 
-        replace_pattern = shortformatfind[0][0]
-        flags = shortformatfind[0][1]
-        width = shortformatfind[0][2]
-        precision = shortformatfind[0][3]
-        specifier = shortformatfind[0][4]
+        replace_pattern, specifier, divisor, argf_format = parsed
         if specifier == 't' :
             # value is a timestamp
             isodate = UTCDateTime(int(arg_value)).isoformat().replace(':','_')
-            isodate.replace(":","_")
-            format_str = format_str + arg["FORMAT"].replace(replace_pattern,isodate)
+            line.append(arg_format.replace(replace_pattern,isodate))
         elif specifier == 'f' :
             # value is a float stored on integer
-            divisor = 1
-            if precision.isnumeric():
-                divisor = 10 ** int(precision)
             argf = float(arg_value) / divisor
-            argf_format = "{:." + precision + "f}"
             argf_str = argf_format.format(argf)
-            format_str = format_str + arg["FORMAT"].replace(replace_pattern,argf_str)
+            line.append(arg_format.replace(replace_pattern,argf_str))
         else :
-            format_str = format_str + arg["FORMAT"] % arg_value
-    return format_str + "\r\n"       
+            line.append(arg_format % arg_value)
+    line.append("\r\n")
+    return "".join(line), pos
 
 
-# Decrypt one file with LOG, WARN,and ERR cards give in arguments
-def decrypt_one(path,LOG_card,WARN_card,ERR_card,short_card):
+# Decrypt one file with the LOG, WARN, ERR, and SHORT cards of a database
+def decrypt_one(path,database):
     '''
 
-    Read a file byte by byte and wait for header characters.
+    Read a file at once and search it for header characters.
     Depending on the header, we decrypt an explicit (decrypt_explicit) or implicit log (decrypt_short).
 
     Keyword arguments:
-    f -- file reader
-    LOG_card -- Object for LOG decryption (database)
-    WARN_card -- Object for WARNING decryption (database)
-    ERR_card -- Object for ERROR decryption (database)
+    path -- binary file path
+    database -- DecryptDatabase
 
     '''
-    #parse data
-    string =""
     with open(path, "rb") as f:
-        byte = f.read(1)
-        while byte != b'':
-            byte = f.read(1)
-            if byte != b'#':
-                if byte != b'@':
-                    continue
-                else :
-                    string += decrypt_short(f,short_card);
-            else :
-                byte = f.read(1)
-                if byte != b'*':
-                    continue
-                else :
-                    string += decrypt_explicit(f,LOG_card,WARN_card,ERR_card);
-    return string
+        binary = f.read()
+    data = memoryview(binary)
+    end = len(binary)
+
+    #parse data
+    lines = []
+    # The first byte is never a header (it was always skipped)
+    pos = 1
+    next_explicit = binary.find(b'#', pos)
+    next_short = binary.find(b'@', pos)
+    while pos < end:
+        if -1 < next_explicit < pos :
+            next_explicit = binary.find(b'#', pos)
+        if -1 < next_short < pos :
+            next_short = binary.find(b'@', pos)
+        if next_explicit == -1 and next_short == -1 :
+            break
+
+        if next_short == -1 or -1 < next_explicit < next_short :
+            # "#" must be immediately followed by "*"; the byte after "#" is
+            # consumed either way (so that, e.g., "##*" is not a header)
+            pos = next_explicit + 2
+            if binary[next_explicit+1:pos] == b'*':
+                line, pos = decrypt_explicit(data,pos,database)
+                lines.append(line)
+        else :
+            line, pos = decrypt_short(data,next_short+1,database)
+            lines.append(line)
+    return "".join(lines)
+
+
+# Decrypt one BIN file into its LOG file (worker of decrypt_all)
+def decrypt_file(binary_file,database_file_path):
+    '''
+    Decrypt a binary file into a .LOG file, then delete the binary file.
+    Messages printed while decrypting are captured rather than printed, so
+    that those of files decrypted in parallel do not interleave.
+
+    Keyword arguments:
+    binary_file -- binary file path
+    database_file_path -- path of the database JSON file
+
+    Returns the .LOG file path (None if nothing was decrypted), the captured
+    messages, and the traceback of the error that prevented decryption (None
+    if decrypted).
+
+    '''
+    log_file = binary_file.replace(".BIN",".LOG")
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try :
+            database = decrypt_load_database(database_file_path)
+            result = decrypt_one(binary_file,database)
+        except:
+            return None, output.getvalue(), traceback.format_exc()
+    if result :
+        staging.detach(log_file)
+        with open(log_file,"w") as f:
+            f.write(result)
+    else :
+        log_file = None
+    os.remove(binary_file)
+    return log_file, output.getvalue(), None
+
+
+def file_sha256(file_path):
+    '''
+    Return the hexadecimal SHA-256 hash of a file's content
+    '''
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def database_sha256(database_file_path):
+    '''
+    Return the SHA-256 hash of a database file (computed once per run)
+    '''
+    if database_file_path not in database_hashes:
+        database_hashes[database_file_path] = file_sha256(database_file_path)
+    return database_hashes[database_file_path]
+
+
+def databases_sha256(path=None):
+    '''
+    Return the SHA-256 hash of each database file (and of the link file) in
+    path (default : database_path), by name; compiled pickles and the state of
+    database_update are not databases
+    '''
+    if path is None :
+        path = database_path
+    hashes = {}
+    for file_path in sorted(glob.glob(os.path.join(path, "*"))):
+        if file_path.endswith(".pickle") or not os.path.isfile(file_path):
+            continue
+        hashes[os.path.basename(file_path)] = database_sha256(file_path)
+    return hashes
+
+
+def decrypt_manifest_entry(binary_file,database_file_path):
+    '''
+    Return the manifest entry of a binary file: its size, mtime, and content
+    hash, and the name and content hash of the database that decrypts it
+    '''
+    stat = os.stat(binary_file)
+    return {"size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_sha256(binary_file),
+            "database": os.path.basename(database_file_path),
+            "database_sha256": database_sha256(database_file_path)}
+
+
+def decrypt_manifest_match(entry,binary_file,database_file_path):
+    '''
+    Return True if a manifest entry records this (unchanged) binary file, decrypted
+    with this (unchanged) database; the content hash of the binary file is only
+    computed if its size matches but its mtime does not (e.g., it was copied)
+    '''
+    if entry is None :
+        return False
+    if entry["database"] != os.path.basename(database_file_path) \
+       or entry["database_sha256"] != database_sha256(database_file_path):
+        return False
+    stat = os.stat(binary_file)
+    if entry["size"] != stat.st_size:
+        return False
+    if entry["mtime"] == stat.st_mtime:
+        return True
+    return entry["sha256"] == file_sha256(binary_file)
 
 
 # Decrypt all BIN files in a path
-def decrypt_all(path):
+def decrypt_all(path,workers=1,store_path=None):
     '''
     Decrypt all Binary file within a folder.
     1/ Read profiler software version and model number
     2/ Get database file
-    3/ Read byte by byte file and decrypt it into .LOG file
+    3/ Decrypt binary files into .LOG files (on a pool of processes if workers > 1)
     4/ Delete binary file
 
+    If store_path is given, a copy of each .LOG file is kept in that directory
+    along with a manifest (manifest.json) recording, per binary file, its
+    size, mtime, content hash and database (name and content hash), and the
+    resulting .LOG file.  Binary files unchanged since (and decrypted by an
+    unchanged database) reuse their stored .LOG file instead of being
+    decrypted; entries of binary files no longer in path are pruned.
+
     Keyword arguments:
     path -- folder path
+    workers -- number of processes decrypting files (0 or None: one per CPU)
+    store_path -- directory of stored .LOG files and their manifest (optional)
+
+    Returns the list of .LOG files written, in the order of their binary files'
+    names (as are messages printed, whatever the number of workers).
 
     '''
     # Generate List of BINS file
-    files_to_decrypt = glob.glob(path + "*.BIN")
-    files_decrypted = list()
+    files_to_decrypt = sorted(glob.glob(path + "*.BIN"))
+    to_decrypt = list()
     for binary_file in files_to_decrypt :
         # Get version line
         with open(binary_file, "r", errors='replace') as f:
@@ -665,46 +957,94 @@ def decrypt_all(path):
             if database_file != "" :
                 database_file_path = os.path.join(database_path,database_file)
                 if os.path.exists(database_file_path):
-                    # Read and Parse Database binary_file
-                    database =""
-                    with open(database_file_path,"r") as f:
-                        database = f.read()
-                    bin = b''
-                    with open(binary_file,"rb") as bin_file:
-                        bin = bin_file.read()
-
-                    log_file = binary_file.replace(".BIN",".LOG")
-                    binary_file_name = os.path.basename(binary_file)
-                    log_file_name = binary_file_name.replace(".BIN",".LOG")
-
-                    print("convert " + binary_file_name + " to " + log_file_name)
-                    decrypt_list = json.loads(database)
-                    log_card = []
-                    warn_card = []
-                    err_card = []
-                    short_card = []
-                    for decrypt_card in decrypt_list:
-                        if decrypt_card["TYPE"] == "LOG":
-                            log_card = decrypt_card["DECRYPTCARD"]
-                        elif decrypt_card["TYPE"] == "WARN":
-                            warn_card = decrypt_card["DECRYPTCARD"]
-                        elif decrypt_card["TYPE"] == "ERR":
-                            err_card = decrypt_card["DECRYPTCARD"]
-                        elif decrypt_card["TYPE"] == "SHORT":
-                            short_card = decrypt_card["DECRYPTCARD"]
-                    try :
-                        result = decrypt_one(binary_file,log_card,warn_card,err_card,short_card)
-                    except:
-                        print(("FORMAT ERROR :" +str(binary_file)))
-                        traceback.print_exc()
-                    else:
-                        if result :
-                            with open(log_file,"w") as f:
-                                f.write(result)
-                            files_decrypted.append(log_file)
-                        os.remove(binary_file)
+                    # Compile database here (once per run), so that forked
+                    # workers inherit it
+                    decrypt_load_database(database_file_path)
+                    to_decrypt.append((binary_file,database_file_path))
                 else:
                     print(("No database : " + str(database_file_path)))
+
+    # Read the manifest of previously decrypted binary files
+    manifest = {}
+    reused = {}
+    if store_path:
+        manifest_path = os.path.join(store_path, DECRYPT_MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        for binary_file,database_file_path in to_decrypt:
+            binary_file_name = os.path.basename(binary_file)
+            entry = manifest.get(binary_file_name)
+            if decrypt_manifest_match(entry,binary_file,database_file_path):
+                if entry["log"] is None or os.path.exists(os.path.join(store_path, entry["log"])):
+                    reused[binary_file] = entry
+
+    pending = [args for args in to_decrypt if args[0] not in reused]
+    entries = {}
+    if store_path:
+        # Before decryption deletes the binary files
+        for binary_file,database_file_path in pending:
+            entries[binary_file] = decrypt_manifest_entry(binary_file,database_file_path)
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(pending))
+    if workers <= 1:
+        results = (decrypt_file(*args) for args in pending)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(decrypt_file, *zip(*pending)))
+    results = iter(results)
+
+    files_decrypted = list()
+    new_manifest = {}
+    for binary_file,database_file_path in to_decrypt:
+        binary_file_name = os.path.basename(binary_file)
+        log_file_name = binary_file_name.replace(".BIN",".LOG")
+        if binary_file in reused:
+            # Unchanged: reuse the .LOG file stored when it was last decrypted
+            entry = reused[binary_file]
+            print("reuse " + log_file_name + " (unchanged " + binary_file_name + ")")
+            if entry["log"] is not None:
+                log_file = binary_file.replace(".BIN",".LOG")
+                staging.detach(log_file)
+                shutil.copyfile(os.path.join(store_path, entry["log"]), log_file)
+                files_decrypted.append(log_file)
+            os.remove(binary_file)
+            new_manifest[binary_file_name] = entry
+            continue
+
+        log_file, output, error = next(results)
+        print("convert " + binary_file_name + " to " + log_file_name)
+        print(output, end="")
+        if error :
+            print(("FORMAT ERROR :" +str(binary_file)))
+            print(error, end="", file=sys.stderr)
+            continue
+        if log_file :
+            files_decrypted.append(log_file)
+        if store_path:
+            entry = entries[binary_file]
+            entry["log"] = None
+            if log_file :
+                entry["log"] = log_file_name
+                os.makedirs(store_path, exist_ok=True)
+                shutil.copyfile(log_file, os.path.join(store_path, log_file_name))
+            new_manifest[binary_file_name] = entry
+
+    # Write the manifest, and delete stored .LOG files no longer in it
+    if store_path and (manifest or new_manifest):
+        os.makedirs(store_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".", dir=store_path)
+        with os.fdopen(fd, "w") as f:
+            json.dump(new_manifest, f, indent=4, sort_keys=True)
+        os.replace(tmp_path, os.path.join(store_path, DECRYPT_MANIFEST_NAME))
+        kept = {entry["log"] for entry in new_manifest.values()}
+        for entry in manifest.values():
+            if entry.get("log") and entry["log"] not in kept:
+                stale_log = os.path.join(store_path, entry["log"])
+                if os.path.exists(stale_log):
+                    os.remove(stale_log)
+
     return files_decrypted
 
 
@@ -748,7 +1088,91 @@ def sort_log_files(a,b):
 
 
 
-def convert_in_cycle(path,begin,end):
+# Patterns of convert_in_cycle, each with a substring that any matching line
+# contains (tested first, much faster than the regular expression)
+REGEX_DIVING = (re.compile(r"\[DIVING, *\d+\]P? *(\+?\-?\d+)mbar reached"), "mbar reached")
+REGEX_NO_FIX = (re.compile(r"(\d+):\[.+\]<WARN>no fix after"), "<WARN>no fix after")
+REGEX_GPSACK = (re.compile(r"\$GPSACK:.+;"), "$GPSACK:")
+REGEX_GPS_LINE = (re.compile(r"(\d+):\[\w+ *, *\d+\]([S,N])(\d+)deg(\d+.\d+)mn"), "deg")
+REGEX_TIMESTAMP = (re.compile(r"(\d+):"), ":")
+REGEX_INTERNAL_PRESSURE = (re.compile(r'(\d+):.+internal pressure (-?\d+)Pa'), "internal pressure")
+REGEX_BYPASS = (re.compile(r'(\d+):(\[.+\])? +bypass (\d+)ms (\d+)ms'), "bypass")
+
+def search_line(regex, line):
+    '''
+    Return the first match of a (pattern, substring) of convert_in_cycle in a
+    line, or None
+    '''
+    pattern, substring = regex
+    if substring not in line:
+        return None
+    return pattern.search(line)
+
+def cycle_checkpoint_entry(log_file):
+    '''
+    Return the checkpoint entry of a LOG file consumed by convert_in_cycle: its
+    name, size and content hash
+    '''
+    return {"name": os.path.basename(log_file),
+            "size": os.path.getsize(log_file),
+            "sha256": file_sha256(log_file)}
+
+
+def cycle_checkpoint_match(entry,log_file):
+    '''
+    Return True if a checkpoint entry records this (unchanged) LOG file; its
+    content hash is only computed if its name and size match
+    '''
+    if entry["name"] != os.path.basename(log_file):
+        return False
+    if entry["size"] != os.path.getsize(log_file):
+        return False
+    return entry["sha256"] == file_sha256(log_file)
+
+
+def cycle_checkpoint_load(store_path,logFiles):
+    '''
+    Return the checkpoint of convert_in_cycle stored in store_path if it may be
+    resumed from, i.e., it was written by this version, the LOG files it
+    consumed are (unchanged) the first of logFiles (those of the time range,
+    which may thus have been extended, e.g., to present, but not trimmed), and
+    its stored CYCLE files all exist; else None
+    '''
+    checkpoint_path = os.path.join(store_path, CYCLE_CHECKPOINT_NAME)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "r") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("version") != version:
+        return None
+    if len(checkpoint["logs"]) > len(logFiles):
+        return None
+    for entry,logFile in zip(checkpoint["logs"], logFiles):
+        if not cycle_checkpoint_match(entry,logFile):
+            return None
+    for cycle in checkpoint["cycles"]:
+        if not os.path.exists(os.path.join(store_path, cycle)):
+            return None
+    return checkpoint
+
+
+def cycle_checkpoint_save(store_path,checkpoint):
+    '''
+    Write the checkpoint of convert_in_cycle (atomically) in store_path, and
+    delete stored CYCLE files no longer in it
+    '''
+    os.makedirs(store_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".", dir=store_path)
+    with os.fdopen(fd, "w") as f:
+        json.dump(checkpoint, f, indent=4)
+    os.replace(tmp_path, os.path.join(store_path, CYCLE_CHECKPOINT_NAME))
+    kept = set(checkpoint["cycles"])
+    for stale_cycle in glob.glob(os.path.join(store_path, "*.CYCLE")):
+        if os.path.basename(stale_cycle) not in kept:
+            os.remove(stale_cycle)
+
+
+def convert_in_cycle(path,begin,end,store_path=None):
     '''
     Convert all *.LOG files into .CYCLE (LOG >= begin and LOG < end)
     1/ Merge all initialization files before first complete dive (cycle 0)
@@ -763,10 +1187,25 @@ def convert_in_cycle(path,begin,end):
     <CYCLE_NB> : CYCLE NUMBER (0:initialization 1:First dive...)
     <HEXADATE> : Date of file start / Number of seconds from epoch date (January 1st, 1970 at UTC) in hexadecimal format
 
+    Each LOG file is read once and its lines go through a single pass; cycle
+    contents are accumulated in lists of strings, and each CYCLE file is
+    written as soon as the boundary (start of the next dive) is found.
+
+    If store_path is given, a copy of each complete CYCLE file is kept in that
+    directory along with a checkpoint (checkpoint.json) recording the last
+    complete cycle: its number, the LOG files consumed up to it (name, size
+    and content hash), the name of the next cycle and the content carried
+    over to it.  When the LOG files recorded are unchanged (and still the
+    first in the time range), the complete CYCLE files are restored from
+    store_path and conversion resumes from the next LOG file, so that only
+    the trailing cycles are rebuilt (and only those LOG files' messages,
+    e.g., "reboot", printed).
+
     Keyword arguments:
     path -- process path
     begin -- UTCDateTime() object
     end -- UTCDateTime() object
+    store_path -- directory of stored CYCLE files and their checkpoint (optional)
 
     '''
     # Init cycle nb
@@ -775,153 +1214,178 @@ def convert_in_cycle(path,begin,end):
     logFiles = glob.glob(os.path.join(path,"*.LOG"));
     # Sort files by names
     logFiles = sorted(logFiles, key=functools.cmp_to_key(sort_log_files))
-    # Init Log index
-    iLog = 0
     # Init Content of cycle file
-    content = ""
+    content = []
     #Init file name and path variables
     cycle_file_name = None
     cycle_file_path = ""
-    # Split the path
     # Set default delimiter
     delim = "\r\n"
+    # Keep LOG files done during buoy lifetime
+    logFiles = [logFile for logFile in logFiles
+                if begin <= utils.get_date_from_file_name(os.path.basename(logFile)) < end]
+
+    # Resume from the last complete cycle of the previous run
+    checkpoint = None
+    if store_path:
+        checkpoint = cycle_checkpoint_load(store_path,logFiles)
+    if checkpoint:
+        for cycle in checkpoint["cycles"]:
+            shutil.copyfile(os.path.join(store_path, cycle), os.path.join(path, cycle))
+        cycle_nb = checkpoint["cycle_nb"]
+        cycle_file_name = checkpoint["cycle_file_name"]
+        cycle_file_path = os.path.join(path,cycle_file_name)
+        content = [checkpoint["content"]]
+        logs = list(checkpoint["logs"])
+        cycles = list(checkpoint["cycles"])
+        logFiles = logFiles[len(logs):]
+    else:
+        logs = []
+        cycles = []
 
-    while iLog < len(logFiles):
-        # Get filepath
-        logFile = logFiles[iLog]
+    for logFile in logFiles:
         # Get file start date
         start_date = utils.get_date_from_file_name(os.path.basename(logFile))
-        # File has been done during buoy lifetime ?
-        if start_date >= begin and start_date < end :
-            # Init cycle path and cycle name with first file created during lifetime
-            if not cycle_file_name :
-                cycle_file_name = "{:04d}".format(0) + "_" + get_hexa_date(logFile)
-                cycle_file_path = os.path.join(path,cycle_file_name)
-            # Init last date
-            last_date = start_date
-            with open(logFile, "rb") as f:
-                # Read the content of the LOG
-                fileRead = f.read().decode("utf-8","replace")
-                if not fileRead :
-                    iLog = iLog +1
-                    continue
-                fileFixed = ""
-                # Get current delimiter char
-                delim = utils.get_log_delimiter(fileRead)
-                if not delim:
-                    delim = "\r\n"
-                if delim == "\r\n":
-                   fileRead = fileRead.replace("\r\n","\n")
-                   fileRead = fileRead.replace("\r","\n")
-                   delim = "\n"
-                #Split file by line
-                is_dive = False
-                is_finish = False
-                is_gps_fix = False
-                gps_fix_none = 0
-                is_emergency = False
-                is_reboot_in_dive = False
-                lines = utils.split_log_lines(fileRead)
-                for line in lines:
-                    # Is diving ?
-                    if not is_dive and re.findall(r"\[DIVING, *\d+\]P? *(\+?\-?\d+)mbar reached", line) :
-                        is_dive = True
-                    # File is switched ?
-                    if not is_finish and re.findall(r"\*\*\* switching to.*", line) :
-                        is_finish = True
-                    # Gps fix ?
-                    if not is_gps_fix and re.findall(r"GPS fix\.\.\.", line) :
-                        is_gps_fix = True
-
-                    # No GPS without gps fix date ?
-                    gps_none_line = re.findall(r"(\d+):\[.+\]<WARN>no fix after",line)
-                    if gps_none_line:
-                        if not is_gps_fix :
-                            last_datetime = str(int(gps_none_line[0]) - 180)
-                            fileFixed += last_datetime + ":[SURF  ,0022]GPS fix..." + delim
-                            gps_fix_none = 1
-                            is_gps_fix = True
-                        else :
-                            gps_fix_none = gps_fix_none + 1
-                            if gps_fix_none >= 3 :
-                                is_gps_fix = False
-                                gps_fix_none = 0
-
-                    # GPS ACK without gps fix date ?
-                    gps_ack_line = re.findall(r"\$GPSACK:.+;",line)
-                    if gps_ack_line and not is_gps_fix:
-                        last_datetime = str(int(last_date.timestamp))
-                        fileFixed += last_datetime + ":[SURF  ,0022]GPS fix..." + delim
-                        is_gps_fix = True
-                    # GPS line without gps fix date ?
-                    gps_line = re.findall(r"(\d+):\[\w+ *, *\d+\]([S,N])(\d+)deg(\d+.\d+)mn", line)
-                    if gps_line :
-                        if not is_gps_fix :
-                            last_datetime = str(int(last_date.timestamp))
-                            fileFixed += last_datetime + ":[SURF  ,0022]GPS fix..." + delim
+        if store_path:
+            logs.append(cycle_checkpoint_entry(logFile))
+        # Init cycle path and cycle name with first file created during lifetime
+        if not cycle_file_name :
+            cycle_file_name = "{:04d}".format(0) + "_" + get_hexa_date(logFile)
+            cycle_file_path = os.path.join(path,cycle_file_name)
+        # Init last date (UTCDateTime, or the integer timestamp of the last line)
+        last_date = start_date
+        # Read the content of the LOG
+        with open(logFile, "rb") as f:
+            fileRead = f.read().decode("utf-8","replace")
+        if not fileRead :
+            continue
+        # Get current delimiter char
+        delim = utils.get_log_delimiter(fileRead)
+        if delim == "\r\n":
+           fileRead = fileRead.replace("\r\n","\n")
+           fileRead = fileRead.replace("\r","\n")
+           delim = "\n"
+        # Split file by line and fix it: the lines of fileFixed are those of
+        # the LOG with missing "GPS fix..." lines inserted
+        is_dive = False
+        is_finish = False
+        is_gps_fix = False
+        gps_fix_none = 0
+        is_reboot_in_dive = False
+        fileFixed = []
+        for line in utils.split_log_lines(fileRead):
+            # Is diving ?
+            if not is_dive and search_line(REGEX_DIVING, line) :
+                is_dive = True
+            # File is switched ?
+            if not is_finish and "*** switching to" in line :
+                is_finish = True
+            # Gps fix ?
+            if not is_gps_fix and "GPS fix..." in line :
+                is_gps_fix = True
+
+            # No GPS without gps fix date ?
+            gps_none_line = search_line(REGEX_NO_FIX, line)
+            if gps_none_line:
+                if not is_gps_fix :
+                    last_datetime = str(int(gps_none_line.group(1)) - 180)
+                    fileFixed.append(last_datetime + ":[SURF  ,0022]GPS fix...")
+                    gps_fix_none = 1
+                    is_gps_fix = True
+                else :
+                    gps_fix_none = gps_fix_none + 1
+                    if gps_fix_none >= 3 :
                         is_gps_fix = False
-                    # Split line and test
-                    catch = re.findall(r"(\d+):", line)
-                    if len(catch) > 0:
-                        datetime = UTCDateTime(int(catch[0]))
-                        if datetime < start_date :
-                            # line timestamp is before the start date ?
-                            # Replace timestamp by last line timestamp or start date by default
-                            # e.g., 25_643FB6EF.LOG
-                            last_datetime = str(int(last_date.timestamp))
-                            line.replace(catch[0],last_datetime)
-                        last_date = datetime
-                    # Append line into a string with time fixed
-                    fileFixed += line + delim
-                # Complete dive ?
-                is_complete_dive = False
-                if is_dive and is_finish :
-                    is_complete_dive = True
-                elif is_dive :
-                    is_reboot_in_dive = True
-                    print("{} reboot !!!!!!".format(os.path.basename(logFile)))
-
-                # Test if the buoy has dived and surfaced or If the ascent is in the following files
-                if is_complete_dive or is_reboot_in_dive :
-                    # Split content to get before diving (First internal pressure mesurement)
-                    content += str(int(get_hexa_date(logFile),16)) + PREPROCESS_INFOS + "Create " + os.path.basename(logFile) + delim
-                    lines = utils.split_log_lines(fileFixed)
-                    before_dive = None
-                    for index, line in enumerate(lines):
-                        # Wait an internal pressure follower by bypass configuration
-                        internal_pressure = re.findall(r'(\d+):.+internal pressure (-?\d+)Pa', line)
-                        if internal_pressure :
-                            next_index = index
-                            while next_index < len(lines) - 1:
-                                next_index = next_index+1
-                                before_dive = re.findall(r'(\d+):(\[.+\])? +bypass (\d+)ms (\d+)ms', lines[next_index])
-                                if before_dive :
-                                    break;
-                            
-                        # Wait start of next dive
+                        gps_fix_none = 0
+
+            # GPS ACK without gps fix date ?
+            if not is_gps_fix and search_line(REGEX_GPSACK, line):
+                last_datetime = str(int(UTCDateTime(last_date).timestamp))
+                fileFixed.append(last_datetime + ":[SURF  ,0022]GPS fix...")
+                is_gps_fix = True
+            # GPS line without gps fix date ?
+            if search_line(REGEX_GPS_LINE, line) :
+                if not is_gps_fix :
+                    last_datetime = str(int(UTCDateTime(last_date).timestamp))
+                    fileFixed.append(last_datetime + ":[SURF  ,0022]GPS fix...")
+                is_gps_fix = False
+            # Line timestamp (a line timestamped before the start date, e.g.,
+            # in 25_643FB6EF.LOG, is kept as is)
+            catch = search_line(REGEX_TIMESTAMP, line)
+            if catch:
+                last_date = int(catch.group(1))
+            # Append line with time fixed
+            fileFixed.append(line)
+        fileFixed.append("")
+        fileFixed = delim.join(fileFixed)
+        # Complete dive ?
+        is_complete_dive = False
+        if is_dive and is_finish :
+            is_complete_dive = True
+        elif is_dive :
+            is_reboot_in_dive = True
+            print("{} reboot !!!!!!".format(os.path.basename(logFile)))
+
+        file_info = str(int(get_hexa_date(logFile),16)) + PREPROCESS_INFOS + "Create " + os.path.basename(logFile) + delim
+        is_cycle_complete = False
+        # Test if the buoy has dived and surfaced or If the ascent is in the following files
+        if is_complete_dive or is_reboot_in_dive :
+            # Split content to get before diving: the first internal pressure
+            # measurement followed (in any later line) by a bypass configuration
+            content.append(file_info)
+            lines = utils.split_log_lines(fileFixed)
+            before_dive = None
+            for index, line in enumerate(lines):
+                # Wait an internal pressure follower by bypass configuration
+                # (if none follows the first internal pressure, none follows
+                # any later one either)
+                if search_line(REGEX_INTERNAL_PRESSURE, line) :
+                    for next_line in lines[index+1:]:
+                        before_dive = search_line(REGEX_BYPASS, next_line)
                         if before_dive :
-                            # exit the loop
-                            content += before_dive[0][0] + PREPROCESS_END + delim
-                            # Write a complete cycle
-                            with open(cycle_file_path + ".CYCLE", "w") as fcycle:
-                                fcycle.write(content)
-                            # Increment cycle nb and change file name
-                            cycle_nb = cycle_nb + 1
-                            cycle_file_name = "{:04d}".format(cycle_nb) + "_" + get_hexa_date(logFile)
-                            cycle_file_path = os.path.join(path,cycle_file_name)
-                            # Reset content with current file (for next cycle)
-                            content = ""
                             break
-                        content += line + delim
-                # Append filename
-                content += str(int(get_hexa_date(logFile),16)) + PREPROCESS_INFOS + "Create " + os.path.basename(logFile) + delim
-                # Append file content
-                content += fileFixed
-        # Next File
-        iLog = iLog +1
-        #os.remove(logFile)
+                    break
+            if before_dive :
+                content.extend(line + delim for line in lines[:index])
+                # Wait start of next dive
+                content.append(before_dive.group(1) + PREPROCESS_END + delim)
+                # Write a complete cycle
+                with open(cycle_file_path + ".CYCLE", "w") as fcycle:
+                    fcycle.write("".join(content))
+                if store_path:
+                    os.makedirs(store_path, exist_ok=True)
+                    shutil.copyfile(cycle_file_path + ".CYCLE",
+                                    os.path.join(store_path, cycle_file_name + ".CYCLE"))
+                    cycles.append(cycle_file_name + ".CYCLE")
+                # Increment cycle nb and change file name
+                cycle_nb = cycle_nb + 1
+                cycle_file_name = "{:04d}".format(cycle_nb) + "_" + get_hexa_date(logFile)
+                cycle_file_path = os.path.join(path,cycle_file_name)
+                # Reset content with current file (for next cycle)
+                content = []
+                is_cycle_complete = True
+            else :
+                content.extend(line + delim for line in lines)
+        # Append filename
+        content.append(file_info)
+        # Append file content
+        content.append(fileFixed)
+        # Checkpoint after the LOG file completing a cycle (what follows may
+        # still change as LOG files arrive)
+        if store_path and is_cycle_complete :
+            content = ["".join(content)]
+            checkpoint = {"version": version,
+                          "logs": list(logs),
+                          "cycles": list(cycles),
+                          "cycle_nb": cycle_nb,
+                          "cycle_file_name": cycle_file_name,
+                          "content": content[0]}
 
     # Write last incomplete cycle
     if content :
         with open(cycle_file_path + ".CYCLE", "w") as fcycle:
-            fcycle.write(content)
+            fcycle.write("".join(content))
+
+    # Write the checkpoint of the last complete cycle
+    if store_path and checkpoint :
+        cycle_checkpoint_save(store_path,checkpoint)
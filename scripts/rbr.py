@@ -21,20 +21,12 @@ import re
 
 import numpy
 from obspy import UTCDateTime
-import plotly.graph_objs as graph
-import plotly.offline as plotly
-from plotly.subplots import make_subplots
 import struct
 import traceback
-import matplotlib
 import utils
 
-def_mermaid_backend = os.environ.get("MERMAID_BACKEND", matplotlib.get_backend())
-if def_mermaid_backend :
-    print("backend for matplotlib : " + def_mermaid_backend)
-    matplotlib.use(def_mermaid_backend)
-
-import matplotlib.pyplot as plt
+# Plotting libraries, imported on first use
+from utils import plt, plotly, graph, subplots
 
 
 class Dataset:
@@ -201,7 +193,7 @@ class Profile:
 
                 rows_nb = len(dataset.chanellist)-1
                 timestamp = [UTCDateTime(t/1000) for t in dataset.data_array["timestamp"]]
-                figure = make_subplots(rows=rows_nb, cols=1,shared_xaxes=True,vertical_spacing=0.02)
+                figure = subplots.make_subplots(rows=rows_nb, cols=1,shared_xaxes=True,vertical_spacing=0.02)
                 for channel in dataset.chanellist[1:]:
                     channel_name = channel + " (" + dataset.channel_description[channel] + ")"
                     trace = Scatter(x=timestamp,y=dataset.data_array[channel],mode="lines+markers",name=channel_name)
@@ -394,14 +386,18 @@ class Profile:
 class Profiles:
     profiles : list[Profile]
 
-    def __init__(self, base_path : str = ""):
+    def __init__(self, base_path : str = "", files : list[str] = None):
         # Initialize event list (if list is declared above,
         # then elements of the previous instance are kept in memory)
         self.profiles = list()
-        if not base_path:
+        if not base_path and files is None:
             return
-        # Read all S61 files and find profiles associated to the dive
-        profile_files = glob.glob(base_path + "*.RBR")
+        # Read all RBR files (of base_path, or those listed in files) and find
+        # profiles associated to the dive
+        if files is not None:
+            profile_files = [f for f in files if f.endswith(".RBR")]
+        else:
+            profile_files = glob.glob(base_path + "*.RBR")
         for profile_file in profile_files:
             file_name = profile_file.split("/")[-1]
             with open(profile_file, "rb") as f:
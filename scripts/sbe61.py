@@ -19,30 +19,27 @@ import utils
 
 import numpy
 from obspy import UTCDateTime
-import plotly.graph_objs as graph
-import plotly.offline as plotly
 import struct
 import traceback
-import matplotlib as mpl
 
-import matplotlib
-def_mermaid_backend = os.environ.get("MERMAID_BACKEND", matplotlib.get_backend())
-if def_mermaid_backend :
-    print("backend for matplotlib : " + def_mermaid_backend)
-    matplotlib.use(def_mermaid_backend)
-import matplotlib.pyplot as plt
+# Plotting libraries, imported on first use
+from utils import plt, plotly, graph
 
 class Profiles:
     profiles = None
     params = None
 
-    def __init__(self, base_path=None):
+    def __init__(self, base_path=None, files=None):
         # Initialize event list (if list is declared above, then elements of the previous instance are kept in memory)
         self.profiles = list()
-        if not base_path:
+        if not base_path and files is None:
             return
-        # Read all S61 files and find profiles associated to the dive
-        profile_files = glob.glob(base_path + "*.S61")
+        # Read all S61 files (of base_path, or those listed in files) and find
+        # profiles associated to the dive
+        if files is not None:
+            profile_files = [f for f in files if f.endswith(".S61")]
+        else:
+            profile_files = glob.glob(base_path + "*.S61")
         for profile_file in profile_files:
             file_name = profile_file.split("/")[-1]
             with open(profile_file, "rb") as f:
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# Part of automaid -- a Python package to process MERMAID files
+# pymaid environment (Python v3.10)
+#
+# Stage server files into a processed directory without copying their content
+# (reflink, hardlink, or symlink; copy as a last resort)
+
+import os
+import errno
+import shutil
+import tempfile
+
+# Linux ioctl cloning a whole file (copy-on-write, e.g., on Btrfs or XFS)
+FICLONE = 0x40049409
+
+# Staging methods, in order of preference when "auto"; "symlink" must be asked
+# for explicitly because the staged files then disappear along with the server
+# files they point to
+methods = ("reflink", "hardlink", "copy")
+
+def reflink(src, dst):
+    '''Clone `src` to `dst` (an independent file sharing its data blocks on disk)
+
+    Raises:
+        OSError: if the platform or filesystem does not support reflinks
+
+    '''
+    try:
+        import fcntl
+
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks not supported", src)
+
+    with open(src, "rb") as fsrc:
+        try:
+            with open(dst, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+            raise
+
+def stage_file(src, dst_dir, method="auto"):
+    '''Stage server file `src` into directory `dst_dir` (under the same name) and
+    return the staged path and the method that staged it
+
+    Args:
+        src (str): Server file
+        dst_dir (str): Directory to stage it into (an existing `dst_dir`/<name> is replaced)
+        method (str): "auto" (def; reflink, else hardlink, else copy),
+                      "reflink", "hardlink", "symlink", or "copy"; or a tuple
+                      of those, tried in order
+
+    Hardlinks and symlinks share the server file itself, so staged files must
+    never be written in place; see `detach`.
+
+    '''
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    if method == "auto":
+        tries = methods
+    elif isinstance(method, str):
+        tries = (method,)
+    else:
+        tries = method
+
+    for i, try_method in enumerate(tries):
+        try:
+            if try_method == "reflink":
+                reflink(src, dst)
+
+            elif try_method == "hardlink":
+                os.link(src, dst)
+
+            elif try_method == "symlink":
+                os.symlink(os.path.abspath(src), dst)
+
+            else:
+                shutil.copy(src, dst)
+
+        except OSError:
+            # Not supported here (e.g., across filesystems); try the next
+            if i == len(tries) - 1:
+                raise
+            continue
+
+        return dst, try_method
+
+def stage_files(files, dst_dir, method="auto"):
+    '''Stage several server files into directory `dst_dir` (see `stage_file`)
+
+    Returns:
+        list: Staged paths, in the order of `files`
+
+    '''
+    staged = []
+    for src in files:
+        dst, method_used = stage_file(src, dst_dir, method)
+        staged.append(dst)
+
+        # Once a method fails (e.g., reflinks on this filesystem), do not
+        # attempt it again for the following files
+        if method == "auto" or not isinstance(method, str):
+            tries = methods if method == "auto" else method
+            method = tries[tries.index(method_used):]
+
+    return staged
+
+def detach(file_path):
+    '''Make `file_path` a file of its own (a private copy) if it is a symlink or
+    hardlink to another, so that it may be written in place without modifying
+    the server file it was staged from; no-op otherwise (e.g., if it does not
+    exist)
+
+    '''
+    if not os.path.lexists(file_path):
+        return
+
+    if not os.path.islink(file_path) and os.stat(file_path).st_nlink <= 1:
+        return
+
+    dir_name = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".", dir=dir_name)
+    os.close(fd)
+    try:
+        shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+
+    except BaseException:
+        os.remove(tmp_path)
+        raise
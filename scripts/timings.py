@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+#
+# Part of automaid -- a Python package to process MERMAID files
+# pymaid environment (Python v3.10)
+#
+# Per-float, per-stage wall time, CPU time, memory and item counts of the
+# pipeline, written to "timings.json" in the processed directory, and opt-in
+# cProfile profiles of selected stages of selected floats
+
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import collections
+
+try:
+    import resource
+
+except ImportError:
+    # Not on Windows
+    resource = None
+
+# Record timings (cheap enough to always leave on: a handful of system calls
+# per stage)
+enabled = True
+
+# Dictionary of float name -> (ordered) dictionary of stage name -> record
+floats = collections.OrderedDict()
+
+# Name and records of the float being processed, and (wall, CPU) time of its
+# last lap
+current_name = None
+current = None
+last = None
+
+# Profile (cProfile) the stages named in `profile_stages` ("all" for every
+# stage) of the floats named in `profile_floats` (empty for every float), and
+# write [profile_path]/<float>.<stage>.pstats, or, if `profile_top` is set,
+# only the `profile_top` functions of largest cumulative time in
+# [profile_path]/<float>.<stage>.txt
+profile_stages = set()
+profile_floats = set()
+profile_top = 0
+profile_path = None
+
+# Profiler of the current lap, and the statistics of each profiled stage of
+# the current float
+profiler = None
+profile_stats = {}
+
+def cpu_time():
+    '''Return the CPU time (user + system) of this process and of its terminated
+    children (e.g., the workers of a closed pool), in seconds; that of children
+    still alive (e.g., the workers of a pool kept across floats) is not
+    counted, see `lap`
+
+    '''
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def rss():
+    '''Return the current resident set size of this process in MiB, or None if
+    unknown (it is read from /proc/self/statm, i.e., only on Linux)
+
+    '''
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+
+def process_peak_rss():
+    '''Return the peak resident set size of this process (or of its largest
+    terminated child, if larger) since it started, in MiB, or None if unknown;
+    cumulative over all floats processed by this process
+
+    '''
+    if resource is None:
+        return None
+
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # Kilobytes on Linux, bytes on macOS
+    scale = 2**20 if os.uname().sysname == "Darwin" else 2**10
+    return round(rss / scale, 1)
+
+def profiled(mfloat):
+    '''Return True if (some stages of) float `mfloat` are to be profiled
+
+    '''
+    return bool(profile_stages) and (not profile_floats or mfloat in profile_floats)
+
+def start(mfloat):
+    '''Start recording the stages of a float
+
+    '''
+    global current_name, current, last, profiler
+    if not enabled and not profiled(mfloat):
+        return
+
+    current = floats.setdefault(mfloat, collections.OrderedDict())
+    current_name = mfloat
+    if profiled(mfloat):
+        profile_stats.clear()
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    last = (time.perf_counter(), cpu_time())
+
+def lap(stage, count=None, child_cpu_s=None):
+    '''Attribute the time elapsed since the last lap (or `start`) to `stage`
+
+    Stages are laps, not nested intervals, so that the stages of a float add up
+    to its total; a stage lapped several times (e.g., once per cycle)
+    accumulates.  Its "rss_mib" is the largest resident set size of this
+    process at the end of its laps (a sample, not a true peak within the
+    stage).  No-op unless a float is being recorded.
+
+    Its "cpu_s" is the CPU time of this process and of its children that
+    terminated during the lap (see `cpu_time`), plus `child_cpu_s`.
+
+    Args:
+        stage (str): Stage name, e.g., "decrypt"
+        count (int): Number of items (events, cycles, files...) of the stage
+        child_cpu_s (float): CPU time (s) spent during the lap by children still
+                             alive (e.g., the pool of `events.icdf24_executor`),
+                             as they report it
+
+    '''
+    global last, profiler
+    if current is None:
+        return
+
+    # Keep the profile of this lap if its stage is profiled, and start anew
+    if profiler is not None:
+        profiler.disable()
+        if stage in profile_stages or "all" in profile_stages:
+            if stage in profile_stats:
+                profile_stats[stage].add(profiler)
+            else:
+                profile_stats[stage] = pstats.Stats(profiler)
+
+    now = (time.perf_counter(), cpu_time())
+    record = current.setdefault(stage, {"wall_s": 0.0, "cpu_s": 0.0, "laps": 0,
+                                        "count": None, "rss_mib": None})
+    record["wall_s"] += now[0] - last[0]
+    record["cpu_s"] += now[1] - last[1] + (child_cpu_s or 0.0)
+    record["laps"] += 1
+    if count is not None:
+        record["count"] = (record["count"] or 0) + count
+
+    mib = rss()
+    if mib is not None:
+        record["rss_mib"] = max(record["rss_mib"] or 0, mib)
+
+    last = (time.perf_counter(), cpu_time())
+    if profiler is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+def stop():
+    '''Stop recording the stages of the current float (writing its profiles, if
+    any) and return its records
+
+    '''
+    global current, last, profiler
+    if profiler is not None:
+        profiler.disable()
+        profiler = None
+        write_profiles(current_name)
+
+    records = current
+    current = None
+    last = None
+
+    return records
+
+def write_profiles(mfloat):
+    '''Write the profiles of the stages of a float (see `profile_stages`)
+
+    '''
+    if not profile_stats:
+        return
+
+    os.makedirs(profile_path, exist_ok=True)
+    for stage, stats in profile_stats.items():
+        file_base = os.path.join(profile_path, "{:s}.{:s}".format(mfloat, stage))
+        if profile_top:
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats("cumulative").print_stats(profile_top)
+            with open(file_base + ".txt", "w") as f:
+                f.write(stream.getvalue())
+
+        else:
+            stats.dump_stats(file_base + ".pstats")
+
+    profile_stats.clear()
+
+def total(records):
+    '''Return the sums (and largest sampled memory) of the records of one float
+
+    '''
+    mibs = [r["rss_mib"] for r in records.values() if r["rss_mib"] is not None]
+    return {"wall_s": sum(r["wall_s"] for r in records.values()),
+            "cpu_s": sum(r["cpu_s"] for r in records.values()),
+            "rss_mib": max(mibs) if mibs else None}
+
+def write(processed_path, version, creation_datestr, **metadata):
+    '''Write the records of all floats to [processed_path]/timings.json, with
+    the (cumulative) peak memory of this process and its children
+
+    '''
+    timings = {"version": version,
+               "created": creation_datestr,
+               **metadata,
+               "process_peak_rss_mib": process_peak_rss(),
+               "floats": {}}
+    for mfloat, records in floats.items():
+        timings["floats"][mfloat] = {"total": total(records),
+                                     "stages": records}
+
+    timings_file = os.path.join(processed_path, "timings.json")
+    with open(timings_file, "w") as f:
+        json.dump(timings, f, indent=4)
+
+    return timings_file
+
+def summary():
+    '''Return a table of the total time of each stage over all floats, and of
+    each float over all stages
+
+    '''
+    stages = collections.OrderedDict()
+    for records in floats.values():
+        for stage, record in records.items():
+            s = stages.setdefault(stage, {"wall_s": 0.0, "cpu_s": 0.0, "count": None})
+            s["wall_s"] += record["wall_s"]
+            s["cpu_s"] += record["cpu_s"]
+            if record["count"] is not None:
+                s["count"] = (s["count"] or 0) + record["count"]
+
+    fmt = "{:>20s}  {:>10.2f}  {:>10.2f}  {:>8s}\n"
+    string = "{:>20s}  {:>10s}  {:>10s}  {:>8s}\n".format("STAGE", "WALL_S", "CPU_S", "COUNT")
+    for stage, s in stages.items():
+        count = str(s["count"]) if s["count"] is not None else "-"
+        string += fmt.format(stage, s["wall_s"], s["cpu_s"], count)
+
+    string += "\n{:>20s}  {:>10s}  {:>10s}  {:>8s}\n".format("FLOAT", "WALL_S", "CPU_S", "RSS_MIB")
+    for mfloat, records in floats.items():
+        t = total(records)
+        mib = str(t["rss_mib"]) if t["rss_mib"] is not None else "-"
+        string += fmt.format(mfloat, t["wall_s"], t["cpu_s"], mib)
+
+    return string
@@ -9,13 +9,14 @@
 # Last modified by JDS: 06-May-2026
 # Python Python 3.10.15, Darwin Kernel Version 23.6.0
 
+import os
 import re
 import sys
 import struct
+import importlib
 import datetime
 import warnings
 import numpy as np
-import plotly.graph_objs as graph
 
 from obspy import UTCDateTime
 from obspy.io.mseed import util as obspy_util
@@ -25,6 +26,62 @@ import setup
 # Get current version number.
 version = setup.get_version()
 
+#
+# Lazy imports
+#
+
+class LazyModule:
+    '''Stand-in for a module that is only imported when one of its attributes is
+    first accessed (e.g., `plt.figure`), so that the plotting libraries
+    (matplotlib, plotly) are not loaded by runs that do not write any plot
+
+    Args:
+        name (str): Module name, e.g., "matplotlib.pyplot"
+        setup (function): Called (without arguments) just before the import
+
+    '''
+    def __init__(self, name, setup=None):
+        self.__dict__["_name"] = name
+        self.__dict__["_setup"] = setup
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__["_module"]
+        if module is None:
+            if self._setup is not None:
+                self._setup()
+            module = importlib.import_module(self._name)
+            self.__dict__["_module"] = module
+
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return "<lazy module '{:s}'>".format(self._name)
+
+# Backend of matplotlib, once set (see `set_matplotlib_backend`)
+matplotlib_backend = None
+
+def set_matplotlib_backend():
+    '''Set the backend of matplotlib to $MERMAID_BACKEND (def: matplotlib's own)
+    before pyplot is first imported; only the first call has any effect
+
+    '''
+    global matplotlib_backend
+    if matplotlib_backend is not None:
+        return
+
+    import matplotlib
+    matplotlib_backend = os.environ.get("MERMAID_BACKEND", matplotlib.get_backend())
+    if matplotlib_backend:
+        print("backend for matplotlib : " + matplotlib_backend)
+        matplotlib.use(matplotlib_backend)
+
+# Plotting modules, imported on first use
+plt = LazyModule("matplotlib.pyplot", setup=set_matplotlib_backend)
+plotly = LazyModule("plotly.offline")
+graph = LazyModule("plotly.graph_objs")
+subplots = LazyModule("plotly.subplots")
+
 #
 # LOG file utilities
 #
@@ -9,13 +9,14 @@
 
 import re
 import os
-import plotly.graph_objs as graph
-import plotly.offline as plotly
 
 from obspy import UTCDateTime
 
 import setup
 
+# Plotting libraries, imported on first use
+from utils import plotly, graph
+
 # Get current version number
 version = setup.get_version()
 
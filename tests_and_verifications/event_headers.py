@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# Part of automaid -- a Python package to process MERMAID files
+# pymaid environment (Python v3.10)
+#
+# Event-header verification: splits every event block of the .MER files given
+# (by default, all those under this directory) as automaid <= v4.5.9 did,
+# parses each header with the regular expressions of those versions and with
+# `events.EventHeader`, and fails if any field differs.
+#
+# Usage:
+#   $ python event_headers.py [MER_FILE ...]
+#
+# Requires $MERMAID (preprocess.py reads it at import) and $AUTOMAID, or run from
+# this directory.
+
+import os
+import re
+import sys
+import glob
+
+from obspy import UTCDateTime
+
+automaid_path = os.getenv('AUTOMAID', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(automaid_path, 'scripts'))
+import events
+
+def old_headers(content):
+    '''Return the headers of the (completely transmitted) event blocks of .MER
+    file `content`, split as in `Events.__init__` of automaid <= v4.5.9
+
+    '''
+    headers = []
+    for event in content.split(b'</PARAMETERS>')[-1].split(b'<EVENT>')[1:]:
+        if event[0:14] != b"\n\r\t<INFO DATE=" or event[-22:] != b"\n\r\t</DATA>\n\r</EVENT>\n\r":
+            continue
+        headers.append(event.split(b"<DATA>\x0A\x0D")[0])
+
+    return headers
+
+def old_fields(header):
+    '''Return the fields of an event header parsed with the regular expressions
+    of automaid <= v4.5.9 (`Event.__init__` and `Event.set_uncorrected_starttime`),
+    as the attribute names of `events.EventHeader`; absent fields are omitted
+
+    '''
+    def first(pattern):
+        catch = re.findall(pattern, header)
+        return catch[0] if catch else None
+
+    fields = {}
+    for name, pattern, cast in (("rounds", rb" ROUNDS=(-?\d+)", int),
+                                ("stages", rb" STAGES=(-?\d+)", int),
+                                ("trig", rb" TRIG=(\d+)", int),
+                                ("pressure", rb" PRESSURE=(-?\d+)", int),
+                                ("temperature", rb" TEMPERATURE=(-?\d+)", int),
+                                ("criterion", rb" CRITERION=(\d+\.\d+)", float),
+                                ("snr", rb" SNR=(\d+\.\d+)", float),
+                                ("smp_offset", rb"SMP_OFFSET=(\d+)", int),
+                                ("bytes_per_sample", rb"BYTES_PER_SAMPLE=(\d+)", int),
+                                ("length", rb"LENGTH=(\d+)", int)):
+        value = first(pattern)
+        if value is not None:
+            fields[name] = cast(value)
+
+    date = first(rb" DATE=(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6})")
+    if date is not None:
+        fields["info_date"] = UTCDateTime.strptime(date.decode("utf-8"), "%Y-%m-%dT%H:%M:%S.%f")
+
+    date = first(rb" DATE=(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})")
+    if date is not None:
+        fields["info_date_s"] = UTCDateTime.strptime(date.decode("utf-8"), "%Y-%m-%dT%H:%M:%S")
+
+    fname = first(rb"FNAME=(\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2})")
+    if fname is not None:
+        fields["fname"] = UTCDateTime.strptime(fname.decode("utf-8"), "%Y-%m-%dT%H_%M_%S")
+        fname_ms = first(rb"FNAME=\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2}\.?(\d{6}?)")
+        if fname_ms is not None:
+            fields["fname"] += float("0." + fname_ms.decode("utf-8"))
+
+    return fields
+
+def compare(header):
+    '''Return the list of (field, old value, new value) that differ between the
+    old regular expressions and `events.EventHeader` for one event header
+
+    '''
+    old = old_fields(header)
+    new = events.EventHeader(header)
+
+    names = ["info_date", "info_date_s", "fname"] + [name.lower() for name in
+                                                     events.EventHeader.ints + events.EventHeader.floats]
+    diffs = []
+    for name in names:
+        if old.get(name) != getattr(new, name):
+            diffs.append((name, old.get(name), getattr(new, name)))
+
+    return diffs
+
+if __name__ == "__main__":
+    mer_files = sys.argv[1:]
+    if not mer_files:
+        this_path = os.path.dirname(os.path.abspath(__file__))
+        mer_files = sorted(glob.glob(os.path.join(this_path, "**", "*.MER"), recursive=True))
+
+    n_headers = 0
+    n_failed = 0
+    for mer_file in mer_files:
+        with open(mer_file, "rb") as f:
+            content = f.read()
+
+        for header in old_headers(content):
+            n_headers += 1
+            diffs = compare(header)
+            if diffs:
+                n_failed += 1
+                print("FAIL: {:s}: {}".format(mer_file, header[:80]))
+                for name, old, new in diffs:
+                    print("    {:s}: {} (regex) != {} (EventHeader)".format(name, old, new))
+
+    print("Event headers of {:d} .MER files: {:d} checked, {:d} differ"
+          .format(len(mer_files), n_headers, n_failed))
+
+    sys.exit(1 if n_failed or not n_headers else 0)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Part of automaid -- a Python package to process MERMAID files
+# pymaid environment (Python v3.10)
+#
+# Import-time benchmark: imports the modules of the pipeline (everything main.py
+# loads before it reads any file) in fresh interpreters, reports the median wall
+# time, and fails if it exceeds a limit or if a plotting library (matplotlib,
+# plotly) was loaded -- those must only be imported when a plot is written.
+# Also fails if writing the depths of a cycle on CSV only (`--outputs
+# cycle_csv`) loads a plotting library.
+#
+# Usage:
+#   $ python import_time.py [--repeat N] [--max SECONDS]
+#   $ python -X importtime import_time.py --detail   # per-module breakdown
+#
+# Requires $MERMAID (preprocess.py reads it at import) and $AUTOMAID, or run from
+# this directory.
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+automaid_path = os.getenv('AUTOMAID', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+scripts_path = os.path.join(automaid_path, 'scripts')
+
+# Modules of the pipeline, in the order main.py imports them
+modules = ["setup", "utils", "gps", "preprocess", "vitals", "cycles", "events",
+           "sbe41", "sbe61", "rbr", "geocsv", "kml", "cache", "staging", "timings"]
+
+# Top-level packages that must not be loaded by importing the pipeline
+lazy_packages = ["matplotlib", "plotly", "IPython"]
+
+# Run in a fresh interpreter: time the imports and list the lazy packages loaded
+snippet = '''
+import sys, time
+t = time.perf_counter()
+import {modules:s}
+t = time.perf_counter() - t
+loaded = sorted({{m.split(".")[0] for m in sys.modules}} & set({lazy:s}))
+print("{{}}|{{}}".format(t, ",".join(loaded)))
+'''.format(modules=", ".join(modules), lazy=repr(lazy_packages))
+
+# Run in a fresh interpreter: write the CSV (but not the html) of a cycle, and
+# list the lazy packages loaded
+csv_snippet = '''
+import os, sys, tempfile
+import cycles
+cycle = cycles.Cycle.__new__(cycles.Cycle)
+cycle.processed_path = tempfile.mkdtemp() + "/"
+cycle.cycle_name = "0000_5E6D9838.CYCLE"
+cycle.directory_name = "20200315-00h00m00s"
+cycle.is_dive = True
+cycle.cycle_content = ("1584230400:[PRESS ,0038]P  +1500mbar\\r\\n"
+                       "1584230460:[PRESS ,0038]P  +2500mbar\\r\\n")
+cycle.write_cycle_html(True, html=False)
+written = any(f.endswith(".csv") for f in os.listdir(cycle.processed_path))
+loaded = sorted({{m.split(".")[0] for m in sys.modules}} & set({lazy:s}))
+print("{{}}|{{}}".format(written, ",".join(loaded)))
+'''.format(lazy=repr(lazy_packages))
+
+def csv_only_loaded():
+    '''Return whether a cycle was written on CSV only, in a fresh interpreter,
+    and the list of lazy packages that writing it loaded
+
+    '''
+    out = subprocess.run([sys.executable, "-c", csv_snippet], cwd=scripts_path,
+                         stdout=subprocess.PIPE, check=True, text=True).stdout
+    written, loaded = out.strip().splitlines()[-1].split("|")
+    return written == "True", [p for p in loaded.split(",") if p]
+
+def time_import():
+    '''Return the time (s) to import the pipeline modules in a fresh interpreter,
+    and the list of lazy packages that were loaded nonetheless
+
+    '''
+    out = subprocess.run([sys.executable, "-c", snippet], cwd=scripts_path,
+                         stdout=subprocess.PIPE, check=True, text=True).stdout
+    t, loaded = out.strip().splitlines()[-1].split("|")
+    return float(t), [p for p in loaded.split(",") if p]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the import time of automaid")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters (def: 5)")
+    parser.add_argument("--max", type=float, default=1.0, help="Fail above this median time, in seconds (def: 1.0)")
+    parser.add_argument("--detail", action="store_true", help="Import once in this interpreter (for `python -X importtime`)")
+    args = parser.parse_args()
+
+    if args.detail:
+        sys.path.insert(0, scripts_path)
+        for module in modules:
+            __import__(module)
+        sys.exit(0)
+
+    # The first import also compiles *.pyc; do not count it
+    time_import()
+
+    times = []
+    for i in range(args.repeat):
+        t, loaded = time_import()
+        times.append(t)
+
+    median = statistics.median(times)
+    print("Import time of {:d} modules: median {:.3f} s (min {:.3f} s, max {:.3f} s; {:d} runs)"
+          .format(len(modules), median, min(times), max(times), len(times)))
+
+    status = 0
+    if loaded:
+        print("FAIL: plotting libraries loaded at import: {:s}".format(", ".join(loaded)))
+        status = 1
+
+    written, loaded = csv_only_loaded()
+    if not written:
+        print("FAIL: cycle not written on CSV")
+        status = 1
+
+    if loaded:
+        print("FAIL: plotting libraries loaded writing a cycle on CSV only: {:s}".format(", ".join(loaded)))
+        status = 1
+
+    if median > args.max:
+        print("FAIL: median import time exceeds {:.3f} s".format(args.max))
+        status = 1
+
+    sys.exit(status)